@@ -0,0 +1,333 @@
+#! python3
+
+import importlib
+import contextlib
+import threading
+import argparse
+import datetime
+import socket
+import json
+import time
+import sys
+import gc
+import io
+import os
+
+odin = importlib.import_module('client-odin-w2')
+
+#in-process stand-in for the serial port of a module which answers every AT command with OK,
+#the module handles one command at a time and both UART directions are paced at the baud rate
+class SimulatedSerial:
+    def __init__(self, baudrate, atLatency):
+        self.name = 'simulated'
+        self.baudrate = baudrate
+        self.rtscts = False
+        self.timeout = None
+        self.__byteTime = 10 / baudrate
+        self.__atLatency = atLatency
+        self.__rxChunks = []
+        self.__rxBuffer = bytearray()
+        self.__txDone = 0
+        self.__moduleDone = 0
+        self.__hostTxDone = 0
+        self.__edm = False
+        self.__cmBuffer = bytearray()
+        self.__edmDecoder = odin.OdinEdmDecoder()
+
+    def __moduleTx(self, arrival, data):
+        self.__moduleDone = max(arrival, self.__moduleDone) + self.__atLatency
+        self.__txDone = max(self.__moduleDone, self.__txDone) + len(data) * self.__byteTime
+        self.__rxChunks.append((self.__txDone, data))
+
+    def write(self, data):
+        self.__hostTxDone = max(time.monotonic(), self.__hostTxDone) + len(data) * self.__byteTime
+        if self.__edm:
+            for message in self.__edmDecoder.feed(data):
+                self.__moduleTx(self.__hostTxDone, odin.edmFrame(odin.OdinEdmMsg.AtConf, b'\r\nOK\r\n'))
+            return len(data)
+        self.__cmBuffer += data
+        while b'\r' in self.__cmBuffer:
+            eol = self.__cmBuffer.index(b'\r')
+            command = bytes(self.__cmBuffer[:eol + 1])
+            del self.__cmBuffer[:eol + 1]
+            self.__moduleTx(self.__hostTxDone, command + b'\r\nOK\r\n')
+            if command == b'AT+CPWROFF\r':
+                self.__moduleTx(self.__hostTxDone, b'\r\n+STARTUP\r\n')
+            elif command == b'ATO2\r':
+                self.__edm = True
+                self.__moduleTx(self.__hostTxDone, odin.edmFrame(odin.OdinEdmMsg.StartEv, b''))
+        return len(data)
+
+    def __receive(self):
+        now = time.monotonic()
+        while self.__rxChunks and self.__rxChunks[0][0] <= now:
+            self.__rxBuffer += self.__rxChunks.pop(0)[1]
+
+    @property
+    def in_waiting(self):
+        self.__receive()
+        return len(self.__rxBuffer)
+
+    def read(self, size=1):
+        self.__receive()
+        while len(self.__rxBuffer) < size and self.__rxChunks:
+            time.sleep(max(0, self.__rxChunks[0][0] - time.monotonic()))
+            self.__receive()
+        data = bytes(self.__rxBuffer[:size])
+        del self.__rxBuffer[:size]
+        return data
+
+    #the client probes the module before the reboot and drops what arrived in between
+    def reset_input_buffer(self):
+        self.__receive()
+        self.__rxBuffer.clear()
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        line = b''
+        while not line.endswith(b'\n'):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return line
+
+def benchDecoder(args):
+    frame = odin.edmFrame(odin.OdinEdmMsg.DataEv, b'\x00' + bytes(args.size))
+    stream = memoryview(frame * args.frames)
+    decoder = odin.OdinEdmDecoder()
+    frameCount = 0
+    start = time.perf_counter()
+    for i in range(0, len(stream), args.chunk):
+        frameCount += len(decoder.feed(stream[i:i + args.chunk]))
+    elapsed = time.perf_counter() - start
+    if frameCount != args.frames:
+        raise Exception('Decoded {} frames out of {}'.format(frameCount, args.frames))
+    print('decoder: {} frames of {} bytes in {} byte chunks, {:.3f} s, {:.0f} frames/s, {:.2f} MB/s'.format(
+            frameCount, len(frame), args.chunk, elapsed, frameCount / elapsed, len(stream) / elapsed / 1e6))
+
+#DataEv payloads through decoded messages, a message queue and slicing versus the decoder data sink and a ring buffer
+def benchRxAlloc(args):
+    frame = odin.edmFrame(odin.OdinEdmMsg.DataEv, b'\x00' + bytes(args.size))
+    chunk = frame * max(1, args.chunk // len(frame))
+    rounds = max(1, args.frames * len(frame) // len(chunk))
+    frameCount = rounds * (len(chunk) // len(frame))
+    buffer = bytearray(len(chunk))
+    #what the consumer gets for a frame is appended to kept if given
+    def copying(rounds, kept):
+        queue = odin.OdinRxQueue(len(chunk))
+        decoder = odin.OdinEdmDecoder()
+        for i in range(rounds):
+            for message in decoder.feed(chunk):
+                queue.put(message)
+                messages = queue.get(None, 0)
+                data = messages[0].content[1:]
+                if kept is not None:
+                    kept.append(messages)
+                    kept.append(data)
+    def ringBuffer(rounds, kept):
+        ring = odin.OdinRingBuffer(len(chunk))
+        decoder = odin.OdinEdmDecoder(lambda channelId, data: ring.write(data))
+        for i in range(rounds):
+            decoder.feed(chunk)
+            ring.readinto(buffer, 0)
+    #blocks are counted over about 1000 frames with everything handed out per frame kept alive, so that the
+    #blocks allocated for a frame are still there to be counted when the run is over
+    countRounds = max(1, min(rounds, 1000 * len(frame) // len(chunk)))
+    countFrames = countRounds * (len(chunk) // len(frame))
+    for name, func in [('copying', copying), ('ring buffer', ringBuffer)]:
+        gc.collect()
+        collections = gc.get_stats()[0]['collections']
+        start = time.perf_counter()
+        func(rounds, None)
+        elapsed = time.perf_counter() - start
+        collections = gc.get_stats()[0]['collections'] - collections
+        kept = []
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        func(countRounds, kept)
+        blocks = sys.getallocatedblocks() - blocks
+        del kept
+        print('rxalloc {}: {} frames of {} bytes, {:.0f} frames/s, {} gen0 collections, {:.2f} blocks allocated per frame'.format(
+                name, frameCount, len(frame), frameCount / elapsed, collections, blocks / countFrames))
+
+def benchAtBatch(args):
+    commands = odin.OdinGeneralInfoCommands + odin.wifiConfigCommands(args, 0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        odinClient = odin.OdinClient(args, SimulatedSerial(args.linkBaudrate, args.atLatency))
+        odinClient.setDataMode(odin.OdinDataMode.ExtendedDataMode)
+        start = time.perf_counter()
+        for command in commands:
+            odinClient.atCommand(command)
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        results = odinClient.atBatch(commands, args.window)
+        pipelined = time.perf_counter() - start
+    if not all([x.ok for x in results]):
+        raise Exception('AT batch failed')
+    print('atbatch: {} commands at {} baud, sequential {:.3f} s, pipelined {:.3f} s with window {}, speedup {:.2f}'.format(
+            len(commands), args.linkBaudrate, sequential, pipelined, args.window, sequential / pipelined))
+
+#return min/percentiles/max of samples
+def percentiles(samples):
+    samples = sorted(samples)
+    def at(percent):
+        return samples[min(len(samples) - 1, int(percent * len(samples) / 100))]
+    return {'count': len(samples), 'min': samples[0], 'p50': at(50), 'p90': at(90), 'p99': at(99), 'max': samples[-1]}
+
+#channel is an OdinChannel or an OdinConnection, raise socket.timeout if nothing came for timeout seconds
+def recvExactly(channel, buffer, size, timeout=None):
+    channel.settimeout(timeout)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        nbytes = channel.recv_into(view[received:size])
+        if not nbytes:
+            raise Exception('Channel {} disconnected'.format(channel.channelId))
+        received += nbytes
+
+#return {phase: seconds} of the bring-up sequence of __main__ and the client with an open echo channel
+def bringUp(args):
+    phases = {}
+    start = time.perf_counter()
+    def phase(name):
+        nonlocal start
+        now = time.perf_counter()
+        phases[name] = now - start
+        start = now
+    odinClient = odin.OdinClient(args)
+    phase('startup')
+    if not odinClient.setDataMode(odin.OdinDataMode.ExtendedDataMode):
+        raise Exception('Switch to {} failed'.format(odin.OdinDataMode.ExtendedDataMode.name))
+    odinClient.startReader()
+    phase('edm')
+    odinClient.setWifiConfig(0)
+    phase('wifiConfig')
+    odinClient.activateWifiConfig(0)
+    if not odinClient.waitforWifiConnected(0, args.waitTimeout):
+        raise Exception('Wait for WIFI link establishment failed')
+    phase('wifi')
+    if not odinClient.waitforNetworkUp(0, args.waitTimeout):
+        raise Exception('Wait for network up failed')
+    phase('network')
+    manager = odin.OdinChannelManager(odinClient)
+    channel = manager.open(args.host, args.port, timeout=args.waitTimeout)
+    if channel is None:
+        raise Exception('Connecting to {}:{} failed'.format(args.host, args.port))
+    phase('peer')
+    phases['total'] = sum(phases.values())
+    return phases, odinClient, channel
+
+#return (upstream, bidirectional) bytes/s of pushing total bytes through the echo server in size chunks, both
+#over the time to the last echoed byte as sendall returns once the data is queued and not once it got through,
+#upstream counts the bytes that made it to the server and back, bidirectional counts them once per direction so
+#that bytes lost with a link are not, the echo stops being waited for once nothing came for timeout
+def throughput(channel, size, total, timeout=None):
+    channel.settimeout(timeout)
+    payload = bytes(size)
+    buffer = bytearray(65536)
+    total = total // size * size
+    received = 0
+    last = None
+    def drain():
+        nonlocal received, last
+        while received < total:
+            try:
+                nbytes = channel.recv_into(buffer, min(len(buffer), total - received))
+            except (socket.timeout, ConnectionError):
+                break
+            if not nbytes:
+                break
+            received += nbytes
+            last = time.perf_counter()
+    drainer = threading.Thread(target=drain)
+    drainer.start()
+    start = time.perf_counter()
+    try:
+        for i in range(total // size):
+            channel.sendall(payload)
+    finally:
+        drainer.join()
+    if last is None:
+        return 0.0, 0.0
+    return received / (last - start), 2 * received / (last - start)
+
+#latency and throughput of a simulated or real module, written as JSON
+def benchLink(args):
+    simulator = None
+    if args.simulate:
+        sim = importlib.import_module('simulator-odin-w2')
+        simulator = sim.OdinSimulator(sim.argParser().parse_args(['--baudrate', str(args.simBaudrate)]))
+        threading.Thread(target=simulator.serveForever, daemon=True).start()
+        args.device = simulator.device
+    sizes = [int(x) for x in args.sizes.split(',')]
+    results = {'timestamp': datetime.datetime.now().isoformat(), 'device': args.device,
+               'simulated': simulator is not None, 'baudrate': args.baudrate, 'rtscts': args.rtscts}
+    if simulator is not None:
+        results['simBaudrate'] = args.simBaudrate
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results['bringUp'], odinClient, channel = bringUp(args)
+        samples = []
+        for i in range(args.count):
+            start = time.perf_counter()
+            odinClient.atCommand('')
+            samples.append(time.perf_counter() - start)
+        results['atRtt'] = percentiles(samples)
+        results['echoRtt'] = {}
+        results['upstream'] = {}
+        results['bidirectional'] = {}
+        buffer = bytearray(max(sizes))
+        for size in sizes:
+            payload = bytes(size)
+            samples = []
+            for i in range(args.count):
+                start = time.perf_counter()
+                channel.sendall(payload)
+                recvExactly(channel, buffer, size)
+                samples.append(time.perf_counter() - start)
+            results['echoRtt'][size] = percentiles(samples)
+            results['upstream'][size], results['bidirectional'][size] = throughput(channel, size, args.total)
+        channel.close()
+        results['stats'] = odinClient.stats.snapshot()
+    if simulator is not None:
+        simulator.shutdown()
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(results, output, indent=2)
+    output.write('\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    decoderParser = subparsers.add_parser('decoder', help='EDM decoder throughput')
+    decoderParser.add_argument('--frames', help='number of frames', type=int, default=100000)
+    decoderParser.add_argument('--size', help='payload size in bytes', type=int, default=64)
+    decoderParser.add_argument('--chunk', help='bytes per feed', type=int, default=4096)
+    decoderParser.set_defaults(func=benchDecoder)
+    rxAllocParser = subparsers.add_parser('rxalloc', help='allocations of the copying and the ring buffer receive path')
+    rxAllocParser.add_argument('--frames', help='number of frames', type=int, default=100000)
+    rxAllocParser.add_argument('--size', help='payload size in bytes', type=int, default=512)
+    rxAllocParser.add_argument('--chunk', help='bytes per feed', type=int, default=4096)
+    rxAllocParser.set_defaults(func=benchRxAlloc)
+    atBatchParser = subparsers.add_parser('atbatch', parents=[odin.argParser(add_help=False)],
+                                          help='module bring-up, sequential vs pipelined AT commands')
+    atBatchParser.add_argument('--link-baudrate', dest='linkBaudrate', help='simulated UART baud rate', type=int,
+                               default=odin.OdinDefaultBaudrate)
+    atBatchParser.add_argument('--at-latency', dest='atLatency', help='simulated seconds to process one AT command',
+                               type=float, default=0.002)
+    atBatchParser.add_argument('--window', help='max AT requests in flight', type=int, default=8)
+    atBatchParser.set_defaults(func=benchAtBatch)
+    linkParser = subparsers.add_parser('link', parents=[odin.argParser(add_help=False)],
+                                       help='bring-up time, AT and echo round trip and throughput against server.py')
+    linkParser.add_argument('--simulate', help='run against an in-process simulator-odin-w2 instead of --device',
+                            action='store_true')
+    linkParser.add_argument('--sim-baudrate', dest='simBaudrate', help='UART baud rate emulated by the simulator',
+                            type=int, default=odin.OdinDefaultBaudrate)
+    linkParser.add_argument('--sizes', help='comma separated payload sizes', default='16,256,1024,4092')
+    linkParser.add_argument('--count', help='round trips per measurement', type=int, default=50)
+    linkParser.add_argument('--total', help='bytes per throughput measurement', type=int, default=32768)
+    linkParser.add_argument('-o', '--output', help='JSON output file, stdout if not given')
+    linkParser.set_defaults(func=benchLink)
+    args = parser.parse_args()
+    args.func(args)
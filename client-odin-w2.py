@@ -1,14 +1,26 @@
 #! python3
 
-from enum import Enum
-import datetime
+from enum import Enum, IntEnum
+import itertools
+import random
+import functools
+import hashlib
+import atexit
 import argparse
 import serial
 import time
 import collections
-import re
+import threading
+import asyncio
+import struct
+import socket
+import json
+import sys
+import os
 
-Message = collections.namedtuple('Message', 'type content')
+#event is the typed form of a response, URC or ConnEv/DiscEv content, parsed once when the message is received
+Message = collections.namedtuple('Message', 'type content event', defaults=(None,))
+AtResult = collections.namedtuple('AtResult', 'command ok response')
 
 class OdinDataMode(Enum):
     CommandMode = 0
@@ -19,6 +31,14 @@ class OdinDataMode(Enum):
 OdinEdmSfd = b'\xAA'
 OdinEdmEfd = b'\x55'
 OdinCmSfd = b'\r\n'
+OdinDefaultBaudrate = 115200
+OdinDefaultConfigId = 0
+OdinDefaultChannelList = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 36, 40, 44, 48, 52, 56, 60, 64, 100, 104, 108, 112,
+                          116, 132, 136, 140]
+OdinWorldModeCommand = '+UWCFG=11,0'
+OdinEdmMaxPayloadLen = 0x0FFF
+#DataCmd/DataEv payload carries the message type and the channel id ahead of the data
+OdinEdmMaxDataLen = OdinEdmMaxPayloadLen - 3
 
 class OdinEdmMsg(Enum):
     ConnEv = b'\x00\x11'
@@ -32,6 +52,915 @@ class OdinEdmMsg(Enum):
     iPhoneEv = b'\x00\x61'
     StartEv = b'\x00\x71'
 
+OdinEdmMsgById = {int.from_bytes(x.value, 'big'): x for x in OdinEdmMsg}
+#payload length of a frame that is too short for its message type, a data frame without its channel id is bad
+OdinEdmMinPayloadLen = {OdinEdmMsg.DataEv: 3, OdinEdmMsg.DataCmd: 3}
+
+#SFD, payload length and message type, DataCmd adds the channel id
+OdinEdmHeader = struct.Struct('>BH2s')
+#header and EFD around the payload following the message type
+OdinEdmFrameOverhead = OdinEdmHeader.size + 1
+OdinEdmDataHeader = struct.Struct('>BH2sB')
+
+def edmFrame(msgType, payload):
+    return OdinEdmHeader.pack(OdinEdmSfd[0], len(payload) + 2, msgType.value) + payload + OdinEdmEfd
+
+#collects EDM frames as header/payload/trailer vectors and writes all of them with a single writev,
+#payloads are referenced through memoryviews and never copied, a non-blocking writer keeps what the port did not
+#take until the next flush so the payloads must stay untouched until it returns True
+class OdinEdmWriter:
+    def __init__(self, port, maxFrames=64, blocking=True):
+        self.__port = port
+        try:
+            self.__fileno = port.fileno() if hasattr(os, 'writev') else None
+        except (AttributeError, OSError):
+            self.__fileno = None
+        self.__maxFrames = maxFrames
+        self.__blocking = blocking
+        self.__headers = bytearray(OdinEdmDataHeader.size * maxFrames)
+        self.__headerView = memoryview(self.__headers)
+        self.__vectors = []
+        self.__pending = []
+        self.__frameCount = 0
+        self.writeCount = 0
+        self.byteCount = 0
+        self.capture = None
+
+    #split data into maximum size DataCmd frames of the channel
+    def addData(self, channelId, data):
+        data = memoryview(data)
+        for i in range(0, max(len(data), 1), OdinEdmMaxDataLen):
+            if self.__frameCount == self.__maxFrames:
+                self.flush()
+            fragment = data[i:i + OdinEdmMaxDataLen]
+            offset = self.__frameCount * OdinEdmDataHeader.size
+            OdinEdmDataHeader.pack_into(self.__headers, offset, OdinEdmSfd[0], len(fragment) + 3,
+                                        OdinEdmMsg.DataCmd.value, channelId)
+            self.__vectors += [self.__headerView[offset:offset + OdinEdmDataHeader.size], fragment, OdinEdmEfd]
+            self.__frameCount += 1
+
+    #queue an already framed message, or raw bytes outside of EDM
+    def addFrame(self, frame):
+        self.__vectors.append(frame)
+
+    #return True once everything is written, False if a non-blocking writer has some left
+    def flush(self):
+        if self.__vectors:
+            vectors = self.__vectors
+            self.__vectors = []
+            self.__frameCount = 0
+            self.writeCount += 1
+            self.byteCount += sum([len(x) for x in vectors])
+            if self.capture is not None:
+                self.capture.record(OdinCaptureDirection.Tx, b''.join(vectors))
+            self.__pending += vectors
+        if not self.__pending:
+            return True
+        vectors = self.__pending
+        self.__pending = []
+        if self.__fileno is None:
+            self.__port.write(b''.join(vectors))
+            return True
+        try:
+            written = os.writev(self.__fileno, vectors[:3 * self.__maxFrames])
+        except BlockingIOError:
+            written = 0
+        for i, vector in enumerate(vectors):
+            if written >= len(vector):
+                written -= len(vector)
+                continue
+            remainder = [memoryview(vector)[written:]] + vectors[i + 1:]
+            if not self.__blocking:
+                #the header slots are reused by the next frames
+                self.__pending = [bytes(x) if isinstance(x, memoryview) and x.obj is self.__headers else x
+                                  for x in remainder]
+                return False
+            #the port accepted only part of it, hand the rest to the blocking write of the port
+            for x in remainder:
+                self.__port.write(x)
+            break
+        return True
+
+def atRequest(command):
+    return ('AT' + command + '\r').encode('ascii')
+
+OdinGeneralInfoCommands = ['+CGMI', '+CGMM', '+CGMR', '+CGSN', '+GMI', '+GMM', '+GSN', 'I0', 'I9', 'I10', '+CSGT?']
+
+#return [AT commands] storing the WIFI station configuration given by the command line arguments
+def wifiConfigCommands(args, configId):
+    commands = ['+UWSC={},0,1'.format(configId),
+                '+UWSC={},2,"{}"'.format(configId, args.ssid),
+                '+UWSC={},5,{}'.format(configId, OdinWifiAuthType[args.auth].value)]
+    if OdinWifiAuthType[args.auth] == OdinWifiAuthType.WPA:
+        commands.append('+UWSC={},8,"{}"'.format(configId, args.passphrase))
+    commands.append('+UWSC={},100,{}'.format(configId, OdinIPV4Mode[args.ipv4mode].value))
+    if OdinIPV4Mode[args.ipv4mode] == OdinIPV4Mode.Static:
+        commands.append('+UWSC={},101,{}'.format(configId, args.ipv4addr))
+        commands.append('+UWSC={},102,{}'.format(configId, args.ipv4mask))
+        commands.append('+UWSC={},103,{}'.format(configId, args.ipv4gw))
+    return commands
+
+#return [AT commands] of the configuration applied by OdinClient.provision, the radio is restarted after the world mode
+def provisioningCommands(args, configId):
+    return wifiConfigCommands(args, configId) \
+        + [OdinWorldModeCommand,
+           '+UWCL={}'.format(','.join([str(x) for x in OdinDefaultChannelList])),
+           '+UMSM={}'.format(OdinDataMode[args.startMode].value)]
+
+def provisioningHash(args, configId):
+    return hashlib.sha256('\n'.join(provisioningCommands(args, configId)).encode()).hexdigest()
+
+#the state file is shared by the clients of a process, see fleet.py, its updates go one at a time
+OdinProvisioningStateLock = threading.Lock()
+
+#return {module serial number: {'hash': provisioningHash, 'baudrate': int, 'rtscts': bool}} of the modules seen
+#from this host, hash is there once a module was provisioned with warm start and the UART settings once a run left
+#the module at other than the defaults
+def loadProvisioningState(path):
+    try:
+        with open(path) as stateFile:
+            state = json.load(stateFile)
+    except (OSError, ValueError):
+        return {}
+    return dict([x for x in state.items() if isinstance(x[1], dict)]) if isinstance(state, dict) else {}
+
+#return the (baudrate, rtscts) a module was left at according to its state file entry
+def recordedUart(entry):
+    return entry.get('baudrate', OdinDefaultBaudrate), entry.get('rtscts', False)
+
+def saveProvisioningState(path, state):
+    with open(path + '.tmp', 'w') as stateFile:
+        json.dump(state, stateFile, indent=2)
+    os.replace(path + '.tmp', path)
+
+OdinWifiLinkConnected = collections.namedtuple('OdinWifiLinkConnected', 'configId bssid channel')
+OdinWifiLinkDisconnected = collections.namedtuple('OdinWifiLinkDisconnected', 'configId reason')
+OdinNetworkUp = collections.namedtuple('OdinNetworkUp', 'interfaceId')
+OdinNetworkDown = collections.namedtuple('OdinNetworkDown', 'interfaceId')
+OdinNetworkStatus = collections.namedtuple('OdinNetworkStatus', 'interfaceId statusId value')
+#+UNSTAT=<id>,101 of an interface without an IPv4 address
+OdinNoIpv4Addresses = ('', '0.0.0.0')
+OdinWifiChannelList = collections.namedtuple('OdinWifiChannelList', 'channels')
+OdinWifiConfigParam = collections.namedtuple('OdinWifiConfigParam', 'configId tag value')
+OdinStartMode = collections.namedtuple('OdinStartMode', 'mode')
+OdinPeerHandle = collections.namedtuple('OdinPeerHandle', 'peerHandle')
+OdinPeerConnected = collections.namedtuple('OdinPeerConnected',
+                                           'peerHandle type protocol localAddr localPort remoteAddr remotePort')
+OdinPeerDisconnected = collections.namedtuple('OdinPeerDisconnected', 'peerHandle type')
+OdinChannelConnected = collections.namedtuple('OdinChannelConnected',
+                                              'channelId connectType protocol remoteAddr remotePort localAddr localPort')
+OdinChannelDisconnected = collections.namedtuple('OdinChannelDisconnected', 'channelId')
+
+def textParam(param):
+    return param.strip(b'"').decode()
+
+#return a parser turning the comma separated parameters of a line into eventType, one converter per parameter
+def paramParser(eventType, *converters):
+    def parse(params):
+        params = params.split(b',')
+        if len(params) != len(converters):
+            return None
+        return eventType(*[convert(x) for convert, x in zip(converters, params)])
+    return parse
+
+#the value is the rest of the line, an SSID may hold commas
+def wifiConfigParser(params):
+    configId, tag, value = params.split(b',', 2)
+    return OdinWifiConfigParam(configId=int(configId), tag=int(tag), value=textParam(value))
+
+#+XXXX prefix of a response or URC line to the parser of the parameters after the colon
+OdinLineParsers = {
+    b'+UUWLE': paramParser(OdinWifiLinkConnected, int, textParam, int),
+    b'+UUWLD': paramParser(OdinWifiLinkDisconnected, int, int),
+    b'+UUNU': paramParser(OdinNetworkUp, int),
+    b'+UUND': paramParser(OdinNetworkDown, int),
+    b'+UNSTAT': paramParser(OdinNetworkStatus, int, int, textParam),
+    b'+UWCL': lambda params: OdinWifiChannelList(channels=[int(x) for x in params.split(b',') if x]),
+    b'+UWSC': wifiConfigParser,
+    b'+UMSM': paramParser(OdinStartMode, int),
+    b'+UDCP': paramParser(OdinPeerHandle, int),
+    b'+UUDPC': paramParser(OdinPeerConnected, int, int, int, textParam, int, textParam, int),
+    b'+UUDPD': paramParser(OdinPeerDisconnected, int, int),
+}
+
+#return the event of the first line in payload known to OdinLineParsers, or None
+def parseLines(payload):
+    if not payload:
+        return None
+    for line in payload.split(OdinCmSfd):
+        prefix, colon, params = line.partition(b':')
+        parser = OdinLineParsers.get(prefix) if colon else None
+        if parser is not None:
+            try:
+                return parser(params)
+            except ValueError:
+                return None
+    return None
+
+class OdinCmLineKind(Enum):
+    Echo = 0
+    Response = 1
+    Final = 2
+    Urc = 3
+
+OdinCmLine = collections.namedtuple('OdinCmLine', 'kind content event')
+OdinCmFinalResults = (b'OK', b'ERROR')
+OdinCmUrcPrefixes = (b'+UU', b'+STARTUP')
+
+#splits the command mode byte stream into lines as it is fed and classifies every line once,
+#each byte is scanned for the line end only once whatever the size of the reads
+class OdinCmTokenizer:
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.__pos = 0
+        self.__scan = 0
+        self.__echo = None
+
+    def reset(self):
+        del self.__buffer[:]
+        self.__pos = 0
+        self.__scan = 0
+        self.__echo = None
+
+    #the next line equal to the sent command is its echo
+    def expectEcho(self, command):
+        self.__echo = bytes(command).rstrip(b'\r')
+
+    def feed(self, data):
+        if self.__pos:
+            del self.__buffer[:self.__pos]
+            self.__scan -= self.__pos
+            self.__pos = 0
+        self.__buffer += data
+
+    #return the next OdinCmLine or None if no complete line is buffered
+    def next(self):
+        while True:
+            eol = self.__buffer.find(OdinCmSfd, self.__scan)
+            if eol < 0:
+                self.__scan = max(self.__pos, len(self.__buffer) - len(OdinCmSfd) + 1)
+                return None
+            #the echo is terminated by the command's own \r ahead of the \r\n of the response
+            line = bytes(self.__buffer[self.__pos:eol]).rstrip(b'\r')
+            self.__pos = self.__scan = eol + len(OdinCmSfd)
+            if line:
+                return self.__classify(line)
+
+    def __classify(self, line):
+        if line == self.__echo:
+            self.__echo = None
+            return OdinCmLine(OdinCmLineKind.Echo, line, None)
+        if line in OdinCmFinalResults:
+            return OdinCmLine(OdinCmLineKind.Final, line, None)
+        kind = OdinCmLineKind.Urc if line.startswith(OdinCmUrcPrefixes) else OdinCmLineKind.Response
+        return OdinCmLine(kind, line, parseLines(line))
+
+    #return and drop the bytes following the last line taken, e.g. after the OK of a switch out of command mode
+    def takeRemainder(self):
+        remainder = bytes(self.__buffer[self.__pos:])
+        self.reset()
+        return remainder
+
+#channel id, connect type and protocol ahead of the remote and the local address and port
+OdinConnEvIPv4 = struct.Struct('>BBB4sH4sH')
+OdinConnEvIPv6 = struct.Struct('>BBB16sH16sH')
+OdinConnEvLayouts = {0x02: (socket.AF_INET, OdinConnEvIPv4), 0x03: (socket.AF_INET6, OdinConnEvIPv6)}
+
+def parseConnEv(payload):
+    if not payload or len(payload) < 3:
+        return None
+    family, layout = OdinConnEvLayouts.get(payload[1], (None, None))
+    if layout is None or len(payload) < layout.size:
+        return OdinChannelConnected(payload[0], payload[1], payload[2], None, None, None, None)
+    channelId, connectType, protocol, remoteAddr, remotePort, localAddr, localPort = layout.unpack_from(payload)
+    return OdinChannelConnected(channelId, connectType, protocol, socket.inet_ntop(family, remoteAddr), remotePort,
+                                socket.inet_ntop(family, localAddr), localPort)
+
+def parseDiscEv(payload):
+    return OdinChannelDisconnected(payload[0]) if payload else None
+
+OdinEdmEventParsers = {OdinEdmMsg.AtEv: parseLines, OdinEdmMsg.AtConf: parseLines,
+                       OdinEdmMsg.ConnEv: parseConnEv, OdinEdmMsg.DiscEv: parseDiscEv}
+
+#incremental EDM frame decoder, feed it whatever bytes arrived and it returns the complete frames,
+#with a dataSink DataEv payloads are handed over as memoryviews of the decode buffer instead
+class OdinEdmDecoder:
+    def __init__(self, dataSink=None, channelSink=None):
+        self.__buffer = bytearray()
+        self.dataSink = dataSink
+        #ConnEv/DiscEv are handed to channelSink as they are decoded too, so that they take effect in stream order
+        #with the DataEv payloads of dataSink, they are still returned by feed
+        self.channelSink = channelSink
+        self.resyncCount = 0
+
+    def reset(self):
+        del self.__buffer[:]
+
+    #return [Messages] decoded from the buffered bytes, incomplete trailing frame is kept for the next feed
+    def feed(self, data):
+        buffer = self.__buffer
+        buffer += data
+        frames = []
+        with memoryview(buffer) as view:
+            pos = self.__decode(buffer, view, 0, len(buffer), frames)
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def __decode(self, buffer, view, pos, end, frames):
+        while pos < end:
+            sfd = buffer.find(OdinEdmSfd, pos)
+            if sfd < 0:
+                self.resyncCount += 1
+                pos = end
+                break
+            if sfd != pos:
+                self.resyncCount += 1
+                pos = sfd
+            if end - pos < 3:
+                break
+            payloadLen = ((buffer[pos + 1] << 8) | buffer[pos + 2]) & OdinEdmMaxPayloadLen
+            efd = pos + 3 + payloadLen
+            #the header is checked as soon as the message type is in, a stray SFD with a bogus length must not
+            #hold back the frames behind it until that many bytes arrived
+            if payloadLen >= 2 and end - pos < 5:
+                break
+            edmMsgType = OdinEdmMsgById.get((buffer[pos + 3] << 8) | buffer[pos + 4]) if payloadLen >= 2 else None
+            if edmMsgType is not None and efd >= end:
+                break
+            if edmMsgType is None or buffer[efd] != OdinEdmEfd[0] \
+                    or payloadLen < OdinEdmMinPayloadLen.get(edmMsgType, 2):
+                #bad frame, hunt for the next SFD starting right after this one
+                self.resyncCount += 1
+                pos = buffer.find(OdinEdmSfd, pos + 1)
+                if pos < 0:
+                    pos = end
+                continue
+            if edmMsgType == OdinEdmMsg.DataEv and self.dataSink is not None and payloadLen > 2:
+                #the view must not outlive this call, buffer is compacted when feed returns
+                fragment = view[pos + 6:efd]
+                self.dataSink(buffer[pos + 5], fragment)
+                fragment.release()
+            else:
+                payload = bytes(buffer[pos + 5:efd]) if payloadLen > 2 else None
+                parser = OdinEdmEventParsers.get(edmMsgType)
+                message = Message(type=edmMsgType, content=payload, event=parser(payload) if parser else None)
+                if self.channelSink is not None and edmMsgType in (OdinEdmMsg.ConnEv, OdinEdmMsg.DiscEv):
+                    self.channelSink(message)
+                frames.append(message)
+            pos = efd + 1
+        return pos
+
+#return [Messages] in msgList matched by the received message
+def matchMessage(message, msgList):
+    return [Message(type=x.type, content=message.content, event=message.event) \
+            for x in msgList if x.type == message.type \
+            and ((x.content is None) or (message.content is not None and x.content in message.content))]
+
+#remove and return [Messages] matched by the oldest matching message in messages, or None
+def takeMessage(messages, msgList):
+    for i, message in enumerate(messages):
+        matchMsgList = [message] if msgList is None else matchMessage(message, msgList)
+        if matchMsgList:
+            del messages[i]
+            return matchMsgList
+    return None
+
+#bounded queue of received messages, a consumer takes the oldest message matching what it waits for
+class OdinRxQueue:
+    def __init__(self, maxLen):
+        self.__messages = collections.deque()
+        self.__maxLen = maxLen
+        self.__cond = threading.Condition()
+        self.closed = False
+        self.dropCount = 0
+        self.dropCounts = collections.Counter()
+        self.maxDepth = 0
+
+    def __len__(self):
+        return len(self.__messages)
+
+    #nothing is coming anymore, waiters get what is queued and then None without waiting
+    def close(self):
+        with self.__cond:
+            self.closed = True
+            self.__cond.notify_all()
+
+    def reopen(self):
+        with self.__cond:
+            self.closed = False
+
+    #make room by dropping the oldest message
+    def put(self, message):
+        with self.__cond:
+            if len(self.__messages) >= self.__maxLen:
+                self.dropCounts[self.__messages.popleft().type] += 1
+                self.dropCount += 1
+            self.__messages.append(message)
+            self.maxDepth = max(self.maxDepth, len(self.__messages))
+            self.__cond.notify_all()
+
+    #return None if timed out or [Messages] with all matched messages, msgList None takes any message
+    def get(self, msgList=None, timeout=None):
+        def take():
+            return takeMessage(self.__messages, msgList)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            while True:
+                matchMsgList = take()
+                if matchMsgList is not None:
+                    self.__cond.notify_all()
+                    return matchMsgList
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if self.closed or (remaining is not None and remaining <= 0):
+                    return None
+                self.__cond.wait(remaining)
+
+#preallocated ring buffer of the data received on one channel, the reader thread copies each payload in once
+#and consumers copy it out into their own buffer or borrow a memoryview of it
+class OdinRingBuffer:
+    def __init__(self, capacity):
+        self.__buffer = bytearray(capacity)
+        self.__view = memoryview(self.__buffer)
+        self.__capacity = capacity
+        self.__head = 0
+        self.__size = 0
+        self.__eof = False
+        self.__cond = threading.Condition(threading.Lock())
+        self.dropCount = 0
+        self.maxDepth = 0
+
+    def __len__(self):
+        return self.__size
+
+    #drop and count what does not fit right away, the reader thread writing here must not stall the AT
+    #confirmations and the other channels behind a consumer that does not keep up
+    def write(self, data):
+        with self.__cond:
+            n = len(data)
+            tail = self.__head + self.__size
+            if tail >= self.__capacity:
+                tail -= self.__capacity
+            if n <= self.__capacity - self.__size and n <= self.__capacity - tail:
+                self.__view[tail:tail + n] = data
+                self.__size += n
+                self.maxDepth = max(self.maxDepth, self.__size)
+                #readers only wait on an empty buffer
+                if self.__size == n:
+                    self.__cond.notify_all()
+                return
+            self.__writeWrapped(memoryview(data))
+
+    #slow path of write, called with the lock held when data wraps around or does not fit
+    def __writeWrapped(self, data):
+        while data:
+            space = self.__capacity - self.__size
+            if not space:
+                self.dropCount += len(data)
+                break
+            tail = (self.__head + self.__size) % self.__capacity
+            n = min(space, len(data), self.__capacity - tail)
+            self.__view[tail:tail + n] = data[:n]
+            self.__size += n
+            self.maxDepth = max(self.maxDepth, self.__size)
+            data = data[n:]
+            self.__cond.notify_all()
+
+    #mark the end of the stream, readers get what is buffered and then 0/b''
+    def close(self):
+        with self.__cond:
+            self.__eof = True
+            self.__cond.notify_all()
+
+    def __wait(self, timeout):
+        return self.__cond.wait_for(lambda: self.__size or self.__eof, timeout)
+
+    def __consume(self, n):
+        self.__head = (self.__head + n) % self.__capacity
+        self.__size -= n
+        self.__cond.notify_all()
+
+    #return number of bytes copied into buffer, 0 at end of stream or None if timed out
+    def readinto(self, buffer, timeout=None):
+        buffer = memoryview(buffer).cast('B')
+        with self.__cond:
+            if not self.__wait(timeout):
+                return None
+            n = min(len(buffer), self.__size)
+            first = min(n, self.__capacity - self.__head)
+            buffer[:first] = self.__view[self.__head:self.__head + first]
+            buffer[first:n] = self.__view[:n - first]
+            self.__consume(n)
+            return n
+
+    #return up to size bytes, b'' at end of stream or None if timed out
+    def read(self, size=-1, timeout=None):
+        with self.__cond:
+            if not self.__wait(timeout):
+                return None
+            n = self.__size if size < 0 else min(size, self.__size)
+            first = min(n, self.__capacity - self.__head)
+            data = bytes(self.__view[self.__head:self.__head + first])
+            if first < n:
+                data += self.__view[:n - first]
+            self.__consume(n)
+            return data
+
+    #return a memoryview of the oldest contiguous data without copying, empty at end of stream or None
+    #if timed out, the view stays valid until consume() is called
+    def peek(self, timeout=None):
+        with self.__cond:
+            if not self.__wait(timeout):
+                return None
+            return self.__view[self.__head:self.__head + min(self.__size, self.__capacity - self.__head)]
+
+    def consume(self, n):
+        with self.__cond:
+            self.__consume(n)
+
+#asyncio flavour of OdinRxQueue, put() is called from the event loop reader callback
+class OdinAsyncRxQueue:
+    def __init__(self, maxLen):
+        self.__messages = collections.deque()
+        self.__maxLen = maxLen
+        self.__waiters = []
+        self.dropCount = 0
+        self.dropCounts = collections.Counter()
+        self.maxDepth = 0
+
+    def __len__(self):
+        return len(self.__messages)
+
+    def put(self, message):
+        if len(self.__messages) >= self.__maxLen:
+            self.dropCounts[self.__messages.popleft().type] += 1
+            self.dropCount += 1
+        self.__messages.append(message)
+        self.maxDepth = max(self.maxDepth, len(self.__messages))
+        for waiter in self.__waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def __get(self, msgList):
+        while True:
+            matchMsgList = takeMessage(self.__messages, msgList)
+            if matchMsgList is not None:
+                return matchMsgList
+            waiter = asyncio.get_running_loop().create_future()
+            self.__waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self.__waiters.remove(waiter)
+
+    #return None if timed out or [Messages] with all matched messages, msgList None takes any message
+    async def get(self, msgList=None, timeout=None):
+        try:
+            return await asyncio.wait_for(self.__get(msgList), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class OdinTraceLevel(IntEnum):
+    Off = 0
+    Error = 1
+    Info = 2
+    Frame = 3
+    Payload = 4
+
+class OdinTraceKind(Enum):
+    TxCmd = 1
+    TxData = 2
+    RxMsg = 3
+    RxData = 4
+    RxLine = 5
+
+OdinTraceLabels = {OdinTraceKind.TxCmd: 'TX_CMD', OdinTraceKind.TxData: 'TX_DATA', OdinTraceKind.RxMsg: 'RX_MSG',
+                   OdinTraceKind.RxData: 'RX_DATA', OdinTraceKind.RxLine: 'RX_LINE'}
+
+#sequence number, monotonic ns, kind, message type or channel id and frame length ahead of the first bytes of the frame
+OdinTraceRecord = struct.Struct('<QQBHI')
+
+#log lines with monotonic timestamps and a binary ring of the most recent frames that is dumped on error,
+#call sites test the level attributes before building anything so disabled tracing costs one attribute lookup
+class OdinTracer:
+    def __init__(self, level=OdinTraceLevel.Info, ringFrames=0, snapLen=32, sink=None):
+        self.sink = sink
+        self.__start = time.monotonic_ns()
+        self.__ringFrames = ringFrames
+        self.__snapLen = snapLen
+        self.__slotLen = OdinTraceRecord.size + snapLen
+        self.__ring = bytearray(self.__slotLen * ringFrames)
+        self.__seq = itertools.count(1)
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        self.level = level
+        self.errors = level >= OdinTraceLevel.Error
+        self.info = level >= OdinTraceLevel.Info
+        #frames are handed over when they are logged or recorded in the ring
+        self.frames = level >= OdinTraceLevel.Frame or self.__ringFrames > 0
+
+    def __write(self, timestamp, text):
+        (self.sink or sys.stdout).write('{:.6f} {}\n'.format((timestamp - self.__start) / 1e9, text))
+
+    def log(self, text):
+        self.__write(time.monotonic_ns(), text)
+
+    #log, and dump the frame ring if the error is fatal, errors that are retried would dump it over and over
+    def error(self, text, fatal=False):
+        if self.errors:
+            self.log('ERROR {}'.format(text))
+            if fatal and self.__ringFrames:
+                self.dump()
+
+    #record a frame in the ring, log it at Frame level and its bytes at Payload level
+    def frame(self, kind, ident, data):
+        timestamp = time.monotonic_ns()
+        if self.__ringFrames:
+            seq = next(self.__seq)
+            offset = seq % self.__ringFrames * self.__slotLen
+            snapLen = min(len(data), self.__snapLen)
+            OdinTraceRecord.pack_into(self.__ring, offset, seq, timestamp, kind.value, ident, len(data))
+            offset += OdinTraceRecord.size
+            self.__ring[offset:offset + snapLen] = data[:snapLen]
+        if self.level >= OdinTraceLevel.Frame:
+            self.__write(timestamp, self.__describe(kind, ident, len(data),
+                                                    bytes(data) if self.level >= OdinTraceLevel.Payload else None))
+
+    def __describe(self, kind, ident, length, data):
+        if kind == OdinTraceKind.RxMsg:
+            msgType = OdinEdmMsgById.get(ident)
+            ident = msgType.name if msgType is not None else hex(ident)
+        elif kind == OdinTraceKind.RxLine:
+            ident = OdinCmLineKind(ident).name
+        text = '{} {} {} bytes'.format(OdinTraceLabels[kind], ident, length)
+        return text if data is None else '{} {}'.format(text, data)
+
+    #return [(timestamp ns, OdinTraceKind, message type or channel id, frame length, first bytes)] oldest first
+    def records(self):
+        records = []
+        for offset in range(0, len(self.__ring), self.__slotLen):
+            seq, timestamp, kind, ident, length = OdinTraceRecord.unpack_from(self.__ring, offset)
+            if seq:
+                offset += OdinTraceRecord.size
+                records.append((seq, timestamp, OdinTraceKind(kind), ident, length,
+                                bytes(self.__ring[offset:offset + min(length, self.__snapLen)])))
+        records.sort()
+        return [x[1:] for x in records]
+
+    def dump(self, sink=None):
+        sink = sink or self.sink or sys.stdout
+        records = self.records()
+        sink.write('frame trace, last {} frames\n'.format(len(records)))
+        for timestamp, kind, ident, length, data in records:
+            sink.write('  {:.6f} {} {}\n'.format((timestamp - self.__start) / 1e9,
+                                                 self.__describe(kind, ident, length, None), data.hex()))
+
+class OdinCaptureDirection(Enum):
+    Rx = 0
+    Tx = 1
+
+OdinCaptureMagic = b'ODINCAP1'
+#magic and wall clock ns at the start of a session, sessions are appended one after the other
+OdinCaptureHeader = struct.Struct('<8sQ')
+#ns since the start of the session, direction and length ahead of the bytes
+OdinCaptureRecord = struct.Struct('<QBI')
+
+#append-only capture of the raw UART byte stream in both directions, read back by readCapture,
+#every record goes to the file in one unbuffered write so a killed client leaves at most one record torn
+class OdinCapture:
+    def __init__(self, path):
+        self.__file = open(path, 'ab', buffering=0)
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic_ns()
+        self.__file.write(OdinCaptureHeader.pack(OdinCaptureMagic, time.time_ns()))
+        atexit.register(self.close)
+
+    def record(self, direction, data):
+        record = OdinCaptureRecord.pack(time.monotonic_ns() - self.__start, direction.value, len(data)) + data
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.write(record)
+
+    def close(self):
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.close()
+
+#yield (wall clock ns at the session start, ns since the session start, OdinCaptureDirection, bytes) of a capture file,
+#a torn record skips to the next session
+def readCapture(path):
+    with open(path, 'rb') as captureFile:
+        capture = captureFile.read()
+    if not capture.startswith(OdinCaptureMagic):
+        raise Exception('{} is not a capture file'.format(path))
+    pos = 0
+    while pos < len(capture):
+        if capture.startswith(OdinCaptureMagic, pos) and pos + OdinCaptureHeader.size <= len(capture):
+            session = OdinCaptureHeader.unpack_from(capture, pos)[1]
+            pos += OdinCaptureHeader.size
+            continue
+        end = pos + OdinCaptureRecord.size
+        if end <= len(capture):
+            timestamp, direction, length = OdinCaptureRecord.unpack_from(capture, pos)
+            if direction in (OdinCaptureDirection.Rx.value, OdinCaptureDirection.Tx.value) and end + length <= len(capture):
+                yield session, timestamp, OdinCaptureDirection(direction), capture[end:end + length]
+                pos = end + length
+                continue
+        pos = capture.find(OdinCaptureMagic, pos + 1)
+        if pos < 0:
+            return
+
+#rxFrames, rxBytes, txFrames, txBytes and the bytes dropped by the buffers the channel had before its id was reused
+OdinStatsChannelFields = ('rxFrames', 'rxBytes', 'txFrames', 'txBytes', 'retiredDrops')
+
+#phase timings and counters of one client, kept as plain lists and read only by snapshot() so that counting
+#costs the reader thread a few additions, the client registers its queues, decoder and writer for the rest
+class OdinStats:
+    def __init__(self, device):
+        self.device = device
+        self.started = time.time()
+        self.phases = {}
+        self.rx = dict([(x, [0, 0]) for x in OdinEdmMsg])
+        self.tx = dict([(x, [0, 0]) for x in OdinEdmMsg])
+        self.channels = {}
+        self.rxBytes = 0
+        self.readCount = 0
+        self.atCommands = 0
+        self.atErrors = 0
+        self.atTimeouts = 0
+        self.queues = {}
+        self.channelQueues = lambda: {}
+        self.decoder = None
+        self.writer = None
+
+    def addPhase(self, name, seconds):
+        phase = self.phases.setdefault(name, [0, 0.0, 0.0])
+        phase[0] += 1
+        phase[1] += seconds
+        phase[2] = seconds
+
+    def channel(self, channelId):
+        counters = self.channels.get(channelId)
+        if counters is None:
+            counters = self.channels.setdefault(channelId, [0] * len(OdinStatsChannelFields))
+        return counters
+
+    def countRx(self, msgType, size):
+        counters = self.rx[msgType]
+        counters[0] += 1
+        counters[1] += size
+
+    def countTx(self, msgType, frames, size):
+        counters = self.tx[msgType]
+        counters[0] += frames
+        counters[1] += size
+
+    def countRxData(self, channelId, size):
+        self.countRx(OdinEdmMsg.DataEv, size)
+        counters = self.channel(channelId)
+        counters[0] += 1
+        counters[1] += size
+
+    def countTxData(self, channelId, frames, size):
+        self.countTx(OdinEdmMsg.DataCmd, frames, size)
+        counters = self.channel(channelId)
+        counters[2] += frames
+        counters[3] += size
+
+    #a new connection got the channel id, what its old buffer dropped is kept here
+    def retireChannel(self, channelId, dropCount):
+        self.channel(channelId)[4] += dropCount
+
+    #return a dict of plain values that json can dump, queue depths and drops are in messages except for the
+    #ring buffers of OdinClient channels that count bytes
+    def snapshot(self):
+        rx = dict([(x.name, {'frames': frames, 'bytes': size, 'drops': 0}) for x, (frames, size) in self.rx.items()])
+        queues = {}
+        for name, queue in self.queues.items():
+            queues[name] = {'depth': len(queue), 'maxDepth': queue.maxDepth, 'drops': queue.dropCount}
+            for msgType, count in dict(queue.dropCounts).items():
+                #command mode lines have no type
+                if msgType is not None:
+                    rx[msgType.name]['drops'] += count
+        channelQueues = self.channelQueues()
+        channels = {}
+        for channelId in sorted(set(self.channels) | set(channelQueues)):
+            counters = dict(zip(OdinStatsChannelFields, self.channel(channelId)))
+            retiredDrops = counters.pop('retiredDrops')
+            queue = channelQueues.get(channelId)
+            counters['depth'] = len(queue) if queue is not None else 0
+            counters['maxDepth'] = queue.maxDepth if queue is not None else 0
+            counters['drops'] = retiredDrops + (queue.dropCount if queue is not None else 0)
+            channels[channelId] = counters
+        return {'device': self.device,
+                'started': self.started,
+                'uptime': time.time() - self.started,
+                'phases': dict([(x, {'count': count, 'seconds': seconds, 'last': last})
+                                for x, (count, seconds, last) in self.phases.items()]),
+                'rx': rx,
+                'tx': dict([(x.name, {'frames': frames, 'bytes': size}) for x, (frames, size) in self.tx.items()]),
+                'channels': channels,
+                'queues': queues,
+                'at': {'commands': self.atCommands, 'errors': self.atErrors, 'timeouts': self.atTimeouts},
+                'uart': {'rxBytes': self.rxBytes, 'reads': self.readCount,
+                         'txBytes': self.writer.byteCount if self.writer is not None else 0,
+                         'writes': self.writer.writeCount if self.writer is not None else 0,
+                         'resyncs': self.decoder.resyncCount if self.decoder is not None else 0}}
+
+#method decorator adding the time spent in the method to the phase name of self.stats, for coroutines too
+def timedPhase(name):
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def asyncWrapper(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(self, *args, **kwargs)
+                finally:
+                    self.stats.addPhase(name, time.perf_counter() - start)
+            return asyncWrapper
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.stats.addPhase(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+#return the snapshot in the Prometheus text exposition format, every sample labelled with the device
+def statsPrometheus(snapshot):
+    lines = []
+    def metric(name, kind, description, samples):
+        lines.append('# HELP odin_{} {}'.format(name, description))
+        lines.append('# TYPE odin_{} {}'.format(name, kind))
+        for labels, value in samples:
+            labelText = ','.join(['{}="{}"'.format(x, y) for x, y in [('device', snapshot['device'])] + labels])
+            lines.append('odin_{}{{{}}} {}'.format(name, labelText, value))
+    phases = snapshot['phases'].items()
+    metric('phase_seconds_total', 'counter', 'Time spent in the bring-up phase',
+           [([('phase', x)], y['seconds']) for x, y in phases])
+    metric('phase_count_total', 'counter', 'Times the bring-up phase ran', [([('phase', x)], y['count']) for x, y in phases])
+    metric('phase_last_seconds', 'gauge', 'Duration of the last run of the phase',
+           [([('phase', x)], y['last']) for x, y in phases])
+    for direction in ['rx', 'tx']:
+        counters = snapshot[direction].items()
+        metric('{}_frames_total'.format(direction), 'counter', 'EDM frames by message type, AT requests in command mode too',
+               [([('type', x)], y['frames']) for x, y in counters])
+        metric('{}_bytes_total'.format(direction), 'counter', 'EDM payload bytes following the message type',
+               [([('type', x)], y['bytes']) for x, y in counters])
+    metric('rx_dropped_total', 'counter', 'Received messages dropped from a full queue by message type',
+           [([('type', x)], y['drops']) for x, y in snapshot['rx'].items()])
+    channels = snapshot['channels'].items()
+    for field, kind, description in [('rxFrames', 'counter', 'DataEv frames received on the channel'),
+                                     ('rxBytes', 'counter', 'Data bytes received on the channel'),
+                                     ('txFrames', 'counter', 'DataCmd frames sent on the channel'),
+                                     ('txBytes', 'counter', 'Data bytes sent on the channel'),
+                                     ('drops', 'counter', 'Data dropped from the full receive queue of the channel'),
+                                     ('depth', 'gauge', 'Data waiting in the receive queue of the channel'),
+                                     ('maxDepth', 'gauge', 'Highest depth of the receive queue of the channel')]:
+        name = 'channel_' + ''.join(['_' + x.lower() if x.isupper() else x for x in field])
+        metric(name + ('_total' if kind == 'counter' else ''), kind, description,
+               [([('channel', x)], y[field]) for x, y in channels])
+    queues = snapshot['queues'].items()
+    metric('queue_depth', 'gauge', 'Messages waiting in the queue', [([('queue', x)], y['depth']) for x, y in queues])
+    metric('queue_max_depth', 'gauge', 'Highest depth of the queue', [([('queue', x)], y['maxDepth']) for x, y in queues])
+    metric('queue_dropped_total', 'counter', 'Messages dropped from the full queue',
+           [([('queue', x)], y['drops']) for x, y in queues])
+    for field, description in [('commands', 'AT commands sent'), ('errors', 'AT commands answered with ERROR'),
+                               ('timeouts', 'AT commands not answered in time')]:
+        metric('at_{}_total'.format(field), 'counter', description, [([], snapshot['at'][field])])
+    for field, name, description in [('rxBytes', 'uart_rx_bytes_total', 'Bytes read from the UART'),
+                                     ('reads', 'uart_reads_total', 'Reads from the UART'),
+                                     ('txBytes', 'uart_tx_bytes_total', 'Bytes written to the UART'),
+                                     ('writes', 'uart_writes_total', 'Writes to the UART'),
+                                     ('resyncs', 'edm_resyncs_total', 'Times the EDM decoder lost the frame boundary')]:
+        metric(name, 'counter', description, [([], snapshot['uart'][field])])
+    metric('uptime_seconds', 'gauge', 'Seconds since the client started', [([], snapshot['uptime'])])
+    return '\n'.join(lines) + '\n'
+
+def statsJson(snapshot):
+    return json.dumps(snapshot, indent=2) + '\n'
+
+OdinStatsFormats = {'json': statsJson, 'prometheus': statsPrometheus}
+
+#write the stats to path in one replace so that a collector never reads a partial file, every interval seconds
+#if interval is set and when the process exits
+def startStatsDump(stats, path, fmt, interval):
+    def dump():
+        with open(path + '.tmp', 'w') as statsFile:
+            statsFile.write(OdinStatsFormats[fmt](stats.snapshot()))
+        os.replace(path + '.tmp', path)
+    def dumpLoop():
+        while not stopped.wait(interval):
+            dump()
+    stopped = threading.Event()
+    atexit.register(dump)
+    if interval:
+        threading.Thread(target=dumpLoop, name='odin-stats', daemon=True).start()
+
 class OdinWifiAuthType(Enum):
     Open = 1
     WPA = 2
@@ -44,113 +973,445 @@ class OdinIPV4Mode(Enum):
     DHCP = 2
 
 class OdinClient:
-    def __init__(self, args):
+    def __init__(self, args, port=None, traceSink=None):
         
         self.args = args
-        self.__serial = serial.Serial(args.device, 115200)
-        print('{} connected to {}'.format(datetime.datetime.now(), self.__serial.name))
-        self.__serial.read(self.__serial.in_waiting)
+        #a read never blocks for longer than an AT command may take, the waits set their own deadlines
+        self.__serial = port if port is not None else serial.Serial(args.device, OdinDefaultBaudrate,
+                                                                    timeout=args.atTimeout)
+        #seconds to wait for the answer to an AT command, bring-up waits take their own deadline
+        self.atTimeout = args.atTimeout
+        self.tracer = OdinTracer(OdinTraceLevel[args.trace], args.traceRing, sink=traceSink)
+        if self.tracer.info:
+            self.tracer.log('connected to {}'.format(self.__serial.name))
+        self.__capture = OdinCapture(args.capture) if args.capture else None
+        self.stats = OdinStats(self.__serial.name)
+        self.__read(self.__serial.in_waiting)
 
         self.__dataMode = OdinDataMode.CommandMode
         self.__atCmdEcho = True
-        self.__txContent = None
+        self.__cmTokenizer = OdinCmTokenizer()
+        self.__cmResponse = []
+        self.__cmUrcs = collections.deque(maxlen=args.rxQueueLen)
+        self.__edmDecoder = OdinEdmDecoder()
+        self.__rxFrames = collections.deque()
+        self.__txLock = threading.Lock()
+        self.__atLock = threading.RLock()
+        self.__edmWriter = OdinEdmWriter(self.__serial)
+        self.__edmWriter.capture = self.__capture
+        self.__reader = None
+        self.__readerRunning = False
+        self.readerError = None
+        self.__atConfQueue = OdinRxQueue(args.rxQueueLen)
+        self.__eventQueue = OdinRxQueue(args.rxQueueLen)
+        #confirmations of commands that timed out which may still come, see __drainAtConf
+        self.__atConfOwed = 0
+        self.__dataBuffers = {}
+        #the reader thread and the channels opened by the application both look up the buffers
+        self.__dataBuffersLock = threading.Lock()
+        self.__subscribers = collections.defaultdict(list)
+        self.stats.queues = {'atConf': self.__atConfQueue, 'event': self.__eventQueue}
+        self.stats.channelQueues = lambda: dict(self.__dataBuffers)
+        self.stats.decoder = self.__edmDecoder
+        self.stats.writer = self.__edmWriter
+        if args.stats:
+            startStatsDump(self.stats, args.stats, args.statsFormat, args.statsInterval)
 
-        if not self.reboot():
-            raise Exception('Reboot failed')
-        if not self.waitForStartup():
-            raise Exception('Timed out when waiting for +STARTUP flag')
+        #a module provisioned with an EDM start mode boots into EDM and one left running by an earlier run keeps
+        #its UART settings, it is probed so that the reboot goes out in the mode and at the settings it is at
+        self.serialNumber = self.__probeModule()
+        #warm is True if the module was found running with the configuration stored by provision
+        self.warm = args.warmStart and self.__warmStart(OdinDefaultConfigId)
+        if not self.warm:
+            if not self.reboot():
+                raise Exception('Reboot failed')
+            if not self.waitForStartup(args.waitTimeout):
+                raise Exception('Timed out when waiting for +STARTUP flag')
+        if (args.baudrate, args.rtscts) != (self.__serial.baudrate, self.__serial.rtscts):
+            self.negotiateUart(args.baudrate, args.rtscts)
+        self.__recordUart()
+
+    #return the serial number of the module, leaving the client in the mode and at the UART settings the module
+    #answered at, or None and the client in command mode at the defaults
+    @timedPhase('probe')
+    def __probeModule(self, probeTimeout=0.5):
+        traceLevel = self.tracer.level
+        #a probe in the wrong mode fails by design, its errors are not traced
+        self.tracer.setLevel(OdinTraceLevel.Off)
+        try:
+            for baudrate, rtscts in self.__uartCandidates():
+                if (baudrate, rtscts) != (self.__serial.baudrate, self.__serial.rtscts):
+                    self.__reconfigureUart(baudrate, rtscts)
+                serialNumber = self.__probeSerialNumber(probeTimeout)
+                if serialNumber is not None:
+                    return serialNumber
+        finally:
+            self.tracer.setLevel(traceLevel)
+        self.__dataMode = OdinDataMode.CommandMode
+        self.__reconfigureUart(OdinDefaultBaudrate, False)
+        return None
+
+    #return [(baudrate, rtscts)] the module may be at, +UMRS settings last until a reboot so a module left running
+    #is at the ones of the previous run, with warm start the ones asked for and recorded are tried first
+    def __uartCandidates(self):
+        recorded = [recordedUart(x) for x in loadProvisioningState(self.args.stateFile).values()]
+        requested = (self.args.baudrate, self.args.rtscts)
+        default = (OdinDefaultBaudrate, False)
+        candidates = [requested] + recorded + [default] if self.args.warmStart else [default, requested] + recorded
+        return list(collections.OrderedDict.fromkeys(candidates))
 
-    def __txCommand(self, command):
+    #keep the UART settings the module is left at in the state file for the probe of the next run
+    def __recordUart(self):
+        if self.serialNumber is None:
+            return
+        uart = (self.__serial.baudrate, self.__serial.rtscts)
+        with OdinProvisioningStateLock:
+            state = loadProvisioningState(self.args.stateFile)
+            entry = state.get(self.serialNumber, {})
+            if recordedUart(entry) == uart:
+                return
+            entry['baudrate'], entry['rtscts'] = uart
+            state[self.serialNumber] = entry
+            saveProvisioningState(self.args.stateFile, state)
+
+    #return True if the module holds the configuration of the state file, the hash only tells what this host
+    #stored so the SSID and the start mode are read back from the module too
+    @timedPhase('warmStart')
+    def __warmStart(self, configId):
+        if self.serialNumber is None:
+            return False
+        entry = loadProvisioningState(self.args.stateFile).get(self.serialNumber, {})
+        warm = entry.get('hash') == provisioningHash(self.args, configId) \
+            and self.getWifiConfig(configId, 2) == self.args.ssid \
+            and self.getStartMode() == OdinDataMode[self.args.startMode]
+        if self.tracer.info:
+            self.tracer.log('module {} in {}, {} start'.format(self.serialNumber, self.__dataMode.name,
+                                                               'warm' if warm else 'cold'))
+        return warm
+
+    #return the serial number answered in EDM or in command mode, leaving the client in that mode, or None, with
+    #warm start EDM is probed first as the previous run leaves the module there unless it was power cycled since
+    def __probeSerialNumber(self, probeTimeout):
+        modes = [OdinDataMode.CommandMode, OdinDataMode.ExtendedDataMode]
+        if self.args.warmStart:
+            modes.reverse()
+        for mode in modes:
+            self.__serial.reset_input_buffer()
+            self.__cmTokenizer.reset()
+            self.__edmDecoder.reset()
+            self.__dataMode = mode
+            if mode == OdinDataMode.CommandMode and mode != modes[0]:
+                #the line may start with what a command mode module kept of the EDM probe, a bare AT flushes it
+                self.__probe(probeTimeout)
+            response = self.__probe(probeTimeout, '+CGSN')
+            if response is not None:
+                lines = [x.strip(b'"') for x in response.split(OdinCmSfd) if x and x not in OdinCmFinalResults]
+                return lines[0].decode() if lines else ''
+        return None
+
+    #received bytes go through here to be captured, sent ones are captured by the EDM writer
+    def __read(self, size):
+        rxBuffer = self.__serial.read(size)
+        self.stats.readCount += 1
+        self.stats.rxBytes += len(rxBuffer)
+        if self.__capture is not None and rxBuffer:
+            self.__capture.record(OdinCaptureDirection.Rx, rxBuffer)
+        return rxBuffer
+
+    #command is one or, with frames set, several framed AT requests in EDM
+    def __txCommand(self, command, frames=1):
         if self.__dataMode != OdinDataMode.CommandMode and self.__dataMode != OdinDataMode.ExtendedDataMode:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        self.stats.countTx(OdinEdmMsg.AtReq, frames, len(command) - OdinEdmFrameOverhead * frames \
+                           if self.__dataMode == OdinDataMode.ExtendedDataMode else len(command))
         if self.__dataMode == OdinDataMode.CommandMode and self.__atCmdEcho == True:
-            self.__txContent = command
-        print('{} TX_CMD {}'.format(datetime.datetime.now(), command))
-        self.__serial.write(command)
+            self.__cmTokenizer.expectEcho(command)
+        if self.tracer.frames:
+            self.tracer.frame(OdinTraceKind.TxCmd, 0, command)
+        with self.__txLock:
+            self.__edmWriter.addFrame(command)
+            self.__edmWriter.flush()
 
-    def txData(self, data, channelId):
+    #data larger than an EDM frame is split, with flush False the frames are held back so that
+    #several small sends go out in one write at the next flushTx
+    def txData(self, data, channelId, flush=True):
         if self.__dataMode != OdinDataMode.DataMode and self.__dataMode != OdinDataMode.ExtendedDataMode:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            dataLen = len(data) + len(OdinEdmMsg.DataCmd.value) + 1
-            data = OdinEdmSfd + (chr(int(dataLen / 256)) + chr(dataLen % 256)).encode('ascii') \
-                    + OdinEdmMsg.DataCmd.value + chr(channelId).encode('ascii') + data + OdinEdmEfd
-        print('{} TX_DATA {}'.format(datetime.datetime.now(), data))
-        self.__serial.write(data)
-
-    #return True if a SFD is recived or False if receving timed out
-    def __rxStartFrameDelimiter(self):
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            startFramePattern = OdinEdmSfd
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            startFramePattern = OdinCmSfd
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        rxBuffer = self.__serial.read(len(startFramePattern))
-        if len(rxBuffer) < len(startFramePattern):
-            return False
-        startFrame = rxBuffer
-        while startFrame != startFramePattern:
-            oneByte = self.__serial.read(1)
-            if len(oneByte) < 1:
-                return False
-            rxBuffer += oneByte
-            startFrame = startFrame[1:] + rxBuffer[-1:]
-        print('{} RX_SFD {}'.format(datetime.datetime.now(), rxBuffer))
-        return True
+        if self.tracer.frames:
+            self.tracer.frame(OdinTraceKind.TxData, channelId, data)
+        with self.__txLock:
+            if self.__dataMode == OdinDataMode.ExtendedDataMode:
+                self.stats.countTxData(channelId, max((len(data) + OdinEdmMaxDataLen - 1) // OdinEdmMaxDataLen, 1),
+                                       len(data))
+                self.__edmWriter.addData(channelId, data)
+            else:
+                self.__edmWriter.addFrame(data)
+            if flush:
+                self.__edmWriter.flush()
 
-    #return None if receiving timed out or [] if no match message is received or [Messages] with all matched messages
-    def rxMessageList(self, msgList):
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            if False == self.__rxStartFrameDelimiter():
-                return None
-            payloadLen = self.__serial.read(2)
-            if len(payloadLen) < 2:
+    def flushTx(self):
+        with self.__txLock:
+            self.__edmWriter.flush()
+
+    #return next command mode line or None if receiving timed out, bytes are read in bulk and split incrementally
+    def __rxCmLine(self):
+        while True:
+            line = self.__cmTokenizer.next()
+            if line is not None:
+                if self.tracer.frames:
+                    self.tracer.frame(OdinTraceKind.RxLine, line.kind.value, line.content)
+                return line
+            rxBuffer = self.__read(self.__serial.in_waiting or 1)
+            if not rxBuffer:
                 return None
-            payload = self.__serial.read(payloadLen[0] * 256 + payloadLen[1])
-            if len(payload) < payloadLen[0] * 256 + payloadLen[1]:
+            self.__cmTokenizer.feed(rxBuffer)
+
+    #URCs reach the AtEv subscribers in command mode too, and wait for rxMessageList if none of them takes them
+    def __onCmUrc(self, message, msgList):
+        if self.__notify(message._replace(type=OdinEdmMsg.AtEv)):
+            return []
+        matchMsgList = matchMessage(message, msgList)
+        if not matchMsgList:
+            self.__cmUrcs.append(message)
+        return matchMsgList
+
+    #return next decoded EDM frame or None if receiving timed out, bytes are read in bulk and decoded incrementally
+    def __rxEdmFrame(self):
+        while not self.__rxFrames:
+            rxBuffer = self.__read(self.__serial.in_waiting or 1)
+            if not rxBuffer:
                 return None
-            efd = self.__serial.read(1)
-            if len(efd) < 1:
+            self.__rxFrames.extend(self.__feed(rxBuffer))
+        return self.__rxFrames.popleft()
+
+    #DataEv is counted here only when it is not handed to the data sink of the decoder
+    def __feed(self, rxBuffer):
+        resyncCount = self.__edmDecoder.resyncCount
+        messages = self.__edmDecoder.feed(rxBuffer)
+        if self.__edmDecoder.resyncCount != resyncCount:
+            self.tracer.error('EDM framing lost, {} resyncs'.format(self.__edmDecoder.resyncCount))
+        for message in messages:
+            if message.type == OdinEdmMsg.DataEv:
+                self.stats.countRxData(message.content[0], len(message.content) - 1)
+            else:
+                self.stats.countRx(message.type, len(message.content) if message.content else 0)
+        return messages
+
+    def startReader(self):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        if self.__reader is not None:
+            return
+        #frames already decoded by the caller thread must not be lost
+        while self.__rxFrames:
+            self.__dispatch(self.__rxFrames.popleft())
+        self.__edmDecoder.dataSink = self.__onDataSink
+        self.__edmDecoder.channelSink = self.__onChannelEvent
+        self.readerError = None
+        self.__atConfQueue.reopen()
+        self.__eventQueue.reopen()
+        self.__readerRunning = True
+        self.__reader = threading.Thread(target=self.__readerLoop, name='odin-reader', daemon=True)
+        self.__reader.start()
+
+    def stopReader(self):
+        if self.__reader is None:
+            return
+        self.__readerRunning = False
+        if self.__reader is not threading.current_thread():
+            self.__serial.cancel_read()
+            self.__reader.join()
+        self.__reader = None
+        self.__edmDecoder.dataSink = None
+        self.__edmDecoder.channelSink = None
+
+    #stop the reader and release the serial port, the module is left as it is
+    def close(self):
+        self.stopReader()
+        if self.__capture is not None:
+            self.__capture.close()
+        self.__serial.close()
+
+    #an error of the port, the decoder or a subscriber stops the reader, it is kept in readerError and everybody
+    #waiting for a message or for data is woken up to fail instead of running into a timeout
+    def __readerLoop(self):
+        try:
+            while self.__readerRunning:
+                rxBuffer = self.__read(self.__serial.in_waiting or 1)
+                for message in self.__feed(rxBuffer):
+                    self.__dispatch(message)
+        except Exception as e:
+            self.readerError = e
+            self.__readerRunning = False
+            self.tracer.error('Reader thread stopped, {}: {}'.format(type(e).__name__, e), True)
+            self.__atConfQueue.close()
+            self.__eventQueue.close()
+            with self.__dataBuffersLock:
+                for dataBuffer in self.__dataBuffers.values():
+                    dataBuffer.close()
+
+    #DataEv payloads are copied straight from the decoder into the ring buffer of their channel
+    def __onDataSink(self, channelId, data):
+        self.stats.countRxData(channelId, len(data))
+        self.__onData(channelId, data)
+
+    def __onData(self, channelId, data):
+        if self.tracer.frames:
+            self.tracer.frame(OdinTraceKind.RxData, channelId, data)
+        self.dataBuffer(channelId).write(data)
+
+    def __onChannelEvent(self, message):
+        if message.event is None:
+            return
+        if message.type == OdinEdmMsg.ConnEv:
+            #channel id is being reused, data of the new connection goes to a fresh buffer
+            with self.__dataBuffersLock:
+                dataBuffer = self.__dataBuffers.pop(message.event.channelId, None)
+            if dataBuffer is not None:
+                self.stats.retireChannel(message.event.channelId, dataBuffer.dropCount)
+        else:
+            self.dataBuffer(message.event.channelId).close()
+
+    #AtConf goes to the AT confirmation queue, everything else to the subscribers and to the event queue if none
+    #of them took it
+    def __dispatch(self, message):
+        if message.type == OdinEdmMsg.DataEv:
+            self.__onData(message.content[0], memoryview(message.content)[1:])
+        elif message.type == OdinEdmMsg.AtConf:
+            if self.tracer.frames:
+                self.__traceMessage(message)
+            self.__atConfQueue.put(message)
+        else:
+            if self.tracer.frames:
+                self.__traceMessage(message)
+            #the decoder of the reader thread did it already, in order with the data of the channel
+            if self.__edmDecoder.channelSink is None and message.type in (OdinEdmMsg.ConnEv, OdinEdmMsg.DiscEv):
+                self.__onChannelEvent(message)
+            if not self.__notify(message):
+                self.__eventQueue.put(message)
+
+    #return True if a subscriber took the message, every subscriber sees it either way
+    def __notify(self, message):
+        return any([callback(message) for callback in list(self.__subscribers[message.type])])
+
+    def __traceMessage(self, message):
+        self.tracer.frame(OdinTraceKind.RxMsg, int.from_bytes(message.type.value, 'big'), message.content or b'')
+
+    def dataBuffer(self, channelId):
+        with self.__dataBuffersLock:
+            if channelId not in self.__dataBuffers:
+                self.__dataBuffers[channelId] = OdinRingBuffer(self.args.rxBufferSize)
+                #no data comes in anymore once the reader failed
+                if self.readerError is not None:
+                    self.__dataBuffers[channelId].close()
+            return self.__dataBuffers[channelId]
+
+    #return None if timed out or [Messages] with the matched event, requires the reader thread, timeout defaults
+    #to waitTimeout
+    def rxEvent(self, msgList, timeout=None):
+        if self.__reader is None:
+            raise Exception('Reader thread is not running')
+        return self.__eventQueue.get(msgList, timeout or self.args.waitTimeout)
+
+    #callback runs on the reader thread, it returns True to take the message so that it is not queued for the waiters
+    def subscribe(self, msgType, callback):
+        self.__subscribers[msgType].append(callback)
+
+    def unsubscribe(self, msgType, callback):
+        self.__subscribers[msgType].remove(callback)
+
+    #return None if receiving timed out or [] if no match message is received or [Messages] with all matched messages,
+    #timeout only applies to the queues of the reader thread, otherwise a read times out as the port is set up
+    def rxMessageList(self, msgList, timeout=None):
+        if self.__dataMode == OdinDataMode.ExtendedDataMode:
+            if self.__reader is not None:
+                msgTypes = set([x.type for x in msgList])
+                if OdinEdmMsg.DataEv in msgTypes:
+                    raise Exception('DataEv is delivered per channel, use rxData')
+                if msgTypes == set([OdinEdmMsg.AtConf]):
+                    return self.__atConfQueue.get(msgList, timeout)
+                if OdinEdmMsg.AtConf in msgTypes:
+                    raise Exception('AtConf can not be waited together with events')
+                return self.__eventQueue.get(msgList, timeout)
+            message = self.__rxEdmFrame()
+            if message is None:
                 return None
-            edmMsgType = OdinEdmMsg(payload[:2])
-            payload = payload[2:]
-            if 0 == len(payload):
-                payload = None
-            print('{} RX_MSG x{:02x}x{:02x} {} {} x{:02x}'.format(datetime.datetime.now(), payloadLen[0], payloadLen[1], edmMsgType.name, payload, efd[0]))
-            matchMsgList = [Message(type=x.type, content=payload) \
-                            for x in msgList if x.type == edmMsgType \
-                            and ((x.content is None) or (x.content is not None and x.content in payload))]
-            return matchMsgList
+            if self.tracer.frames:
+                self.__traceMessage(message)
+            return matchMessage(message, msgList)
         elif self.__dataMode == OdinDataMode.CommandMode:
-            if self.__atCmdEcho == True and self.__txContent is not None:
-                echoBackData = self.__serial.read(len(self.__txContent))
-                if len(echoBackData) < len(self.__txContent):
-                    return None
-                print('{} RX_ECHO {}'.format(datetime.datetime.now(), echoBackData))
-                self.__txContent = None
-            if False == self.__rxStartFrameDelimiter():
-                return None
-            payload = b''
+            #URCs received while waiting for something else
+            matchMsgList = takeMessage(self.__cmUrcs, msgList)
+            if matchMsgList:
+                return matchMsgList
             while True:
-                rxBuffer = self.__serial.readline()
-                if not rxBuffer:
+                line = self.__rxCmLine()
+                if line is None:
                     return None
-                print('{} RX_MSG {}'.format(datetime.datetime.now(), rxBuffer))
-                payload += rxBuffer
-                matchMsgList = [Message(type=x.type, content=payload) for x in msgList if x.content in payload]
-                if matchMsgList:
-                    return matchMsgList
+                if line.kind == OdinCmLineKind.Urc:
+                    matchMsgList = self.__onCmUrc(Message(type=None, content=line.content, event=line.event), msgList)
+                    if matchMsgList:
+                        return matchMsgList
+                elif line.kind == OdinCmLineKind.Response:
+                    self.__cmResponse.append(line)
+                elif line.kind == OdinCmLineKind.Final:
+                    #the response lines ahead of the final result belong to it
+                    response = self.__cmResponse
+                    self.__cmResponse = []
+                    matchMsgList = [x for x in msgList if x.content is not None and x.content in line.content]
+                    if matchMsgList:
+                        payload = b''.join([x.content + OdinCmSfd for x in response]) + line.content
+                        event = next((x.event for x in response if x.event is not None), None)
+                        return [Message(type=x.type, content=payload, event=event) for x in matchMsgList]
         else:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
 
     def rxMessage(self, message):
         return self.rxMessageList([message])
 
-    def rxData(self):
+    #return [Messages] with all matched messages or None if nothing matched within timeout, None waits as long as
+    #the reads of the port do
+    def waitMessageList(self, msgList, timeout=None):
+        if self.__dataMode == OdinDataMode.ExtendedDataMode and self.__reader is not None:
+            return self.rxMessageList(msgList, timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        oldTimeout = self.__serial.timeout
+        try:
+            while True:
+                if deadline is not None and not self.__setReadDeadline(deadline, oldTimeout):
+                    return None
+                matchMsgList = self.rxMessageList(msgList)
+                if matchMsgList:
+                    return matchMsgList
+                if matchMsgList is None and deadline is None:
+                    return None
+        finally:
+            self.__serial.timeout = oldTimeout
+
+    #bound the next read of the port by deadline, return False if it passed
+    def __setReadDeadline(self, deadline, timeout):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self.__serial.timeout = remaining if timeout is None else min(remaining, timeout)
+        return True
+
+    #return number of bytes copied into buffer, 0 if the channel disconnected or None if timed out,
+    #requires the reader thread
+    def rxDataInto(self, buffer, channelId, timeout=None):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode or self.__reader is None:
+            raise Exception('Unsupported operation without the reader thread at data mode {}'.format(self.__dataMode.name))
+        return self.dataBuffer(channelId).readinto(buffer, timeout)
+
+    def rxData(self, channelId=None):
+        if self.__dataMode == OdinDataMode.ExtendedDataMode and self.__reader is not None:
+            if channelId is None:
+                raise Exception('Channel id is required when the reader thread is running')
+            return self.dataBuffer(channelId).read()
         if self.__dataMode == OdinDataMode.DataMode:
-            data = self.__serial.read(self.__serial.in_waiting)
-            print('{} RX_DATA {}'.format(datetime.datetime.now(), data))
+            data = self.__read(self.__serial.in_waiting)
+            if self.tracer.frames:
+                self.tracer.frame(OdinTraceKind.RxData, 0, data)
             return data
         elif self.__dataMode == OdinDataMode.ExtendedDataMode:
             data = self.rxMessage(Message(type=OdinEdmMsg.DataEv, content=None))
@@ -161,51 +1422,210 @@ class OdinClient:
         else:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
 
-    def atCommand(self, command):
+    #return the confirmation message of the command or None if it failed or no answer came within timeout,
+    #atTimeout by default
+    def __atCommandMessage(self, command, timeout=None):
         if self.__dataMode != OdinDataMode.ExtendedDataMode and self.__dataMode != OdinDataMode.CommandMode:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        payload = ('AT' + command + '\r').encode('ascii')
+        payload = atRequest(command)
         if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            payloadLen = len(payload) + len(OdinEdmMsg.AtReq.value)
-            payload = OdinEdmSfd + (chr(int(payloadLen / 256)) + chr(payloadLen % 256)).encode('ascii') + OdinEdmMsg.AtReq.value + payload + OdinEdmEfd
+            payload = edmFrame(OdinEdmMsg.AtReq, payload)
             expectedMsgList = [Message(type=OdinEdmMsg.AtConf, content=b'OK'), Message(type=OdinEdmMsg.AtConf, content=b'ERROR')]
         else:
             expectedMsgList = [Message(type=None, content=b'OK'), Message(type=None, content=b'ERROR')]
-        self.__txCommand(payload)
-        if len([x for x in self.rxMessageList(expectedMsgList) if b'ERROR' in x.content]):
-            print('AT Command Failed')
-            return False
-        return True
+        with self.__atLock:
+            self.__drainAtConf(expectedMsgList, timeout or self.atTimeout)
+            #lines left over from a command that timed out do not belong to this one
+            self.__cmResponse = []
+            self.__txCommand(payload)
+            self.stats.atCommands += 1
+            respMsgList = self.waitMessageList(expectedMsgList, timeout or self.atTimeout)
+            if respMsgList is None:
+                self.__atConfOwed += 1
+        if respMsgList is None:
+            self.stats.atTimeouts += 1
+            return None
+        if len([x for x in respMsgList if b'ERROR' in x.content]):
+            self.stats.atErrors += 1
+            self.tracer.error('AT command {} failed'.format(command))
+            return None
+        return respMsgList[0]
+
+    #return the response of the command or None if it failed or timed out
+    def atCommandResponse(self, command, timeout=None):
+        message = self.__atCommandMessage(command, timeout)
+        return message.content if message is not None else None
+
+    #return the event parsed from the response of the command, None if it failed, timed out or had no known response
+    def atCommandEvent(self, command, timeout=None):
+        message = self.__atCommandMessage(command, timeout)
+        return message.event if message is not None else None
+
+    def atCommand(self, command, timeout=None):
+        return self.atCommandResponse(command, timeout) is not None
+
+    #the module answers in order, a confirmation owed to a command that timed out comes before the one of the next
+    #command and would be taken for it, so it is waited for and dropped first, one not there within timeout is
+    #taken as lost
+    def __drainAtConf(self, expectedMsgList, timeout):
+        while self.__atConfOwed:
+            self.__atConfOwed -= 1
+            if self.waitMessageList(expectedMsgList, timeout) is None:
+                self.__atConfOwed = 0
+
+    #write up to window requests back to back and match the confirmations to them in order, return [AtResults]
+    #with one result per command, the commands that got no confirmation before a timeout are failed
+    def atBatch(self, commands, window=8):
+        if self.__dataMode == OdinDataMode.CommandMode:
+            #echo handling needs lock-step in command mode
+            results = []
+            for command in commands:
+                response = self.atCommandResponse(command)
+                results.append(AtResult(command=command, ok=response is not None, response=response))
+            return results
+        if self.__dataMode != OdinDataMode.ExtendedDataMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        expectedMsgList = [Message(type=OdinEdmMsg.AtConf, content=b'OK'), Message(type=OdinEdmMsg.AtConf, content=b'ERROR')]
+        results = []
+        with self.__atLock:
+            self.__drainAtConf(expectedMsgList, self.atTimeout)
+            sent = 0
+            while len(results) < len(commands):
+                if sent < len(commands) and sent - len(results) < window:
+                    burst = commands[sent:len(results) + window]
+                    self.__txCommand(b''.join([edmFrame(OdinEdmMsg.AtReq, atRequest(x)) for x in burst]), len(burst))
+                    self.stats.atCommands += len(burst)
+                    sent += len(burst)
+                respMsgList = self.waitMessageList(expectedMsgList, self.atTimeout)
+                if respMsgList is None:
+                    self.stats.atTimeouts += 1
+                    self.tracer.error('AT command {} timed out'.format(commands[len(results)]))
+                    self.__atConfOwed += sent - len(results)
+                    results += [AtResult(command=x, ok=False, response=None) for x in commands[len(results):]]
+                    break
+                if not respMsgList:
+                    continue
+                ok = not len([x for x in respMsgList if b'ERROR' in x.content])
+                if not ok:
+                    self.stats.atErrors += 1
+                    self.tracer.error('AT command {} failed'.format(commands[len(results)]))
+                results.append(AtResult(command=commands[len(results)], ok=ok, response=respMsgList[0].content))
+        return results
 
     def atCommandNoWait(self, command):
         if self.__dataMode != OdinDataMode.ExtendedDataMode and self.__dataMode != OdinDataMode.CommandMode:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        payload = ('AT' + command + '\r').encode('ascii')
+        payload = atRequest(command)
         if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            payloadLen = len(payload) + len(OdinEdmMsg.AtReq.value)
-            payload = OdinEdmSfd + (chr(int(payloadLen / 256)) + chr(payloadLen % 256)).encode('ascii') + OdinEdmMsg.AtReq.value + payload + OdinEdmEfd
+            payload = edmFrame(OdinEdmMsg.AtReq, payload)
         self.__txCommand(payload)
+        self.stats.atCommands += 1
         return True
 
     def setStartMode(self, startMode):
         self.atCommand('+UMSM={}'.format(startMode))
 
+    #return the OdinDataMode the module boots into or None
+    def getStartMode(self):
+        event = self.atCommandEvent('+UMSM?')
+        return OdinDataMode(event.mode) if isinstance(event, OdinStartMode) else None
+
     def storeConfiguration(self):
         self.atCommand('&W')
 
+    @timedPhase('reboot')
     def reboot(self):
         if self.atCommand('+CPWROFF'):
+            self.stopReader()
+            self.__atConfOwed = 0
+            if self.__dataMode != OdinDataMode.CommandMode:
+                self.__cmTokenizer.reset()
             self.__dataMode = OdinDataMode.CommandMode
+            self.__edmDecoder.reset()
+            self.__rxFrames.clear()
+            self.__cmUrcs.clear()
+            #UART settings changed by +UMRS are not kept over a reboot
+            if self.__serial.baudrate != OdinDefaultBaudrate or self.__serial.rtscts:
+                self.__reconfigureUart(OdinDefaultBaudrate, False)
             return True
         return False
 
-    def waitForStartup(self):
-        if self.__dataMode == OdinDataMode.CommandMode:
-            if not self.rxMessage(Message(type=None, content=b'+STARTUP')):
-                return False
+    #switch the module and the port to baudrate and RTS/CTS flow control, return True if the link works at the
+    #new settings or False if it fell back to the old ones
+    @timedPhase('uart')
+    def negotiateUart(self, baudrate, rtscts, probeTimeout=1.0):
+        if self.__dataMode not in (OdinDataMode.CommandMode, OdinDataMode.ExtendedDataMode) or self.__reader is not None:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        oldBaudrate, oldRtscts = self.__serial.baudrate, self.__serial.rtscts
+        if not self.atCommand('+UMRS={},{},8,1,1,1'.format(baudrate, 1 if rtscts else 2)):
+            return False
+        self.__reconfigureUart(baudrate, rtscts)
+        if self.__probe(probeTimeout) is not None:
+            if self.tracer.info:
+                self.tracer.log('UART switched to {} baud, flow control {}'.format(baudrate, rtscts))
             return True
-        else:
+        self.tracer.error('UART probe failed at {} baud, falling back to {} baud'.format(baudrate, oldBaudrate))
+        self.__reconfigureUart(oldBaudrate, oldRtscts)
+        if self.__probe(probeTimeout) is not None:
+            return False
+        raise Exception('Lost the module after switching UART to {} baud'.format(baudrate))
+
+    def __reconfigureUart(self, baudrate, rtscts):
+        self.__serial.flush()
+        self.__serial.baudrate = baudrate
+        self.__serial.rtscts = rtscts
+        self.__serial.reset_input_buffer()
+        self.__cmTokenizer.reset()
+
+    #return the response to command if the module answers within timeout, or None
+    def __probe(self, timeout, command=''):
+        response = self.atCommandResponse(command, timeout)
+        #a probe in the wrong mode or at the wrong UART settings is never answered
+        if response is None:
+            self.__atConfOwed = 0
+        return response
+
+    #the module comes up with +STARTUP in command mode or with a StartEv if its start mode is EDM
+    @timedPhase('startup')
+    def waitForStartup(self, timeout=None):
+        if self.__dataMode != OdinDataMode.CommandMode:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        startup = [Message(type=None, content=b'+STARTUP')]
+        if takeMessage(self.__cmUrcs, startup):
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        oldTimeout = self.__serial.timeout
+        try:
+            return self.__waitForStartup(startup, deadline, oldTimeout)
+        finally:
+            self.__serial.timeout = oldTimeout
+
+    def __waitForStartup(self, startup, deadline, oldTimeout):
+        edmDecoder = OdinEdmDecoder()
+        while True:
+            line = self.__cmTokenizer.next()
+            if line is not None:
+                if self.tracer.frames:
+                    self.tracer.frame(OdinTraceKind.RxLine, line.kind.value, line.content)
+                if line.kind == OdinCmLineKind.Urc \
+                        and self.__onCmUrc(Message(type=None, content=line.content, event=line.event), startup):
+                    return True
+                continue
+            if deadline is not None and not self.__setReadDeadline(deadline, oldTimeout):
+                return False
+            rxBuffer = self.__read(self.__serial.in_waiting or 1)
+            if not rxBuffer:
+                if deadline is not None:
+                    continue
+                return False
+            messages = edmDecoder.feed(rxBuffer)
+            startEv = [i for i, x in enumerate(messages) if x.type == OdinEdmMsg.StartEv]
+            if startEv:
+                self.__dataMode = OdinDataMode.ExtendedDataMode
+                self.__cmTokenizer.reset()
+                self.__rxFrames.extend(messages[startEv[0] + 1:])
+                return True
+            self.__cmTokenizer.feed(rxBuffer)
         
     def factoryReset(self):
         self.atCommand('+UFACTORY')
@@ -215,47 +1635,56 @@ class OdinClient:
             self.__atCmdEcho = False
         
     def generalInfo(self):
-        self.atCommand('+CGMI')
-        self.atCommand('+CGMM')
-        self.atCommand('+CGMR')
-        self.atCommand('+CGSN')
-        self.atCommand('+GMI')
-        self.atCommand('+GMM')
-        self.atCommand('+GSN')
-        self.atCommand('I0')
-        self.atCommand('I9')
-        self.atCommand('I10')
-        self.atCommand('+CSGT?')
+        return self.atBatch(OdinGeneralInfoCommands)
     
     def activateWifiConfig(self, configId):
         self.atCommand('+UWSCA={},3'.format(configId))
 
-    def deactivateWifiConfig(self, i):
+    def deactivateWifiConfig(self, configId):
         self.atCommand('+UWSCA={},4'.format(configId))
 
     def setWifiConfig(self, configId):
-        args = self.args
-        self.atCommand('+UWSC={},0,1'.format(configId))
-        self.atCommand('+UWSC={},2,"{}"'.format(configId, args.ssid))
-        self.atCommand('+UWSC={},5,{}'.format(configId, OdinWifiAuthType[args.auth].value))
-        if OdinWifiAuthType[args.auth] == OdinWifiAuthType.WPA:
-            self.atCommand('+UWSC={},8,"{}"'.format(configId, args.passphrase))
-        self.atCommand('+UWSC={},100,{}'.format(configId, OdinIPV4Mode[args.ipv4mode].value))
-        if OdinIPV4Mode[args.ipv4mode] == OdinIPV4Mode.Static:
-            self.atCommand('+UWSC={},101,{}'.format(configId, args.ipv4addr))
-            self.atCommand('+UWSC={},102,{}'.format(configId, args.ipv4mask))
-            self.atCommand('+UWSC={},103,{}'.format(configId, args.ipv4gw))
+        return self.atBatch(wifiConfigCommands(self.args, configId))
+
+    #return the value of the tag of the Wi-Fi configuration as text or None
+    def getWifiConfig(self, configId, tag):
+        event = self.atCommandEvent('+UWSC={},{}'.format(configId, tag))
+        return event.value if isinstance(event, OdinWifiConfigParam) else None
+
+    #apply the configuration given by the command line arguments, with warm start it is stored in the module and
+    #recorded in the state file so that the next run finds it there
+    @timedPhase('provision')
+    def provision(self, configId):
+        commands = provisioningCommands(self.args, configId)
+        worldMode = commands.index(OdinWorldModeCommand) + 1
+        results = self.atBatch(commands[:worldMode])
+        self.radioReboot()
+        time.sleep(0.5)
+        results += self.atBatch(commands[worldMode:])
+        if not self.args.warmStart:
+            return results
+        results += self.atBatch(['+UWSCA={},1'.format(configId), '&W'])
+        if all([x.ok for x in results]) and self.serialNumber is not None:
+            with OdinProvisioningStateLock:
+                state = loadProvisioningState(self.args.stateFile)
+                state.setdefault(self.serialNumber, {})['hash'] = provisioningHash(self.args, configId)
+                saveProvisioningState(self.args.stateFile, state)
+        return results
+
+    #return True once the network interface has its IPv4 address, the interface is up with the IPv6 link local
+    #address already
+    def isNetworkUp(self, interfaceId):
+        event = self.atCommandEvent('+UNSTAT={},101'.format(interfaceId))
+        return isinstance(event, OdinNetworkStatus) and event.value not in OdinNoIpv4Addresses
 
     def disableRoaming(self):
-        self.atCommand('+UWCFG=7,0')
-        self.atCommand('+UWCFG=8,0')
+        self.atBatch(['+UWCFG=7,0', '+UWCFG=8,0'])
 
     def setWifiForceWorldMode(self, mode):
         self.atCommand('+UWCFG=11,{}'.format(str(mode)))
 
     def radioReboot(self):
-        self.atCommand('+UWCFG=0,0')
-        self.atCommand('+UWCFG=0,1')
+        self.atBatch(['+UWCFG=0,0', '+UWCFG=0,1'])
 
     def setNonDiscovery(self):
         self.atCommand('+UWTDM=1')
@@ -266,118 +1695,881 @@ class OdinClient:
     def setWifiChannelList(self, list):
         self.atCommand('+UWCL={}'.format(','.join([str(x) for x in list])))
 
+    #return [channels] or None
     def getWifiChannelList(self):
-        self.atCommandNoWait('+UWCL?')
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            respMsgList = odinClient.rxMessageList([Message(type=OdinEdmMsg.AtConf, content=b'OK'), Message(type=OdinEdmMsg.AtConf, content=b'ERROR')])
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            respMsgList = odinClient.rxMessageList([Message(type=None, content=b'OK'), Message(type=None, content=b'ERROR')])
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))            
-        if respMsgList and b'OK' in respMsgList[0].content:
-            regex = re.compile('\+UWCL:([0-9](,[0-9]+)*)')
-            sreMatch = regex.search(respMsgList[0].content.decode())
-            if sreMatch:
-                return sreMatch.group(1)
-        return None
+        event = self.atCommandEvent('+UWCL?')
+        return event.channels if isinstance(event, OdinWifiChannelList) else None
 
-    def waitforWifiConnected(self, configId):
+    #return [Messages] with the URC starting with content or None if it did not come within timeout
+    #timeout defaults to waitTimeout
+    def __waitUrc(self, content, timeout):
+        timeout = timeout or self.args.waitTimeout
         if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            while True:
-                if self.rxMessage(Message(type=OdinEdmMsg.AtEv, content=b'+UUWLE')):
-                    return True
+            return self.waitMessageList([Message(type=OdinEdmMsg.AtEv, content=content)], timeout)
         elif self.__dataMode == OdinDataMode.CommandMode:
-            while True:
-                if (self.rxMessage(Message(type=None, content=b'+UUWLE'))):
-                    return True
+            return self.waitMessageList([Message(type=None, content=content)], timeout)
         else:
             raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        return False
 
-    def waitforNetworkUp(self, interfaceId):
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            if self.rxMessage(Message(type=OdinEdmMsg.AtEv, content=b'+UUNU')):
-                return True
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            if self.rxMessage(Message(type=None, content=b'+UUNU')):
-                return True
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
-        return False
+    @timedPhase('wifi')
+    def waitforWifiConnected(self, configId, timeout=None):
+        return self.__waitUrc(b'+UUWLE', timeout) is not None
+
+    #+UUNU comes for the IPv6 link local address first and for the IPv4 lease later, every one is checked
+    @timedPhase('network')
+    def waitforNetworkUp(self, interfaceId, timeout=None):
+        deadline = time.monotonic() + (timeout or self.args.waitTimeout)
+        while not self.isNetworkUp(interfaceId):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.__waitUrc(b'+UUNU', remaining) is None:
+                return False
+        return True
 
+    @timedPhase('l3Addr')
     def getL3Addr(self, interfaceId):
-        self.atCommandNoWait('+UNSTAT={},{}'.format(interfaceId, 101))
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            respMsgList = odinClient.rxMessageList([Message(type=OdinEdmMsg.AtConf, content=b'OK'), Message(type=OdinEdmMsg.AtConf, content=b'ERROR')])
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            respMsgList = odinClient.rxMessageList([Message(type=None, content=b'OK'), Message(type=None, content=b'ERROR')])
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))            
-        if respMsgList and b'OK' in respMsgList[0].content:
-            regex = re.compile('\+UNSTAT:[0-9]+,[0-9]+,([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)')
-            return regex.search(respMsgList[0].content.decode()).group(1)
-        return None
+        event = self.atCommandEvent('+UNSTAT={},{}'.format(interfaceId, 101))
+        return event.value if isinstance(event, OdinNetworkStatus) else None
 
-    def connectToPeer(self, peerAddr, peerPort):
-        self.atCommandNoWait('+UDCP="tcp://{}:{}/"'.format(peerAddr, peerPort))
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            respMsgList = odinClient.rxMessageList([Message(type=OdinEdmMsg.AtConf, content=b'OK'), Message(type=OdinEdmMsg.AtConf, content=b'ERROR')])
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            respMsgList = odinClient.rxMessageList([Message(type=None, content=b'OK'), Message(type=None, content=b'ERROR')])
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))            
-        if respMsgList and b'OK' in respMsgList[0].content:
-            regex = re.compile('\+UDCP:([0-9]+)')
-            return int(regex.search(respMsgList[0].content.decode()).group(1))
-        return None
+    @timedPhase('peer')
+    def connectToPeer(self, peerAddr, peerPort, protocol='tcp'):
+        event = self.atCommandEvent('+UDCP="{}://{}:{}/"'.format(protocol, peerAddr, peerPort))
+        return event.peerHandle if isinstance(event, OdinPeerHandle) else None
 
-    def waitforPeerConnection(self, peerHandle):
-        if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            messageList = self.rxMessage(Message(type=OdinEdmMsg.AtEv, content=b'+UUDPC'))
-            if messageList:
-                regex = re.compile('\+UUDPC:([0-9]+),')
-                if peerHandle == int(regex.search(messageList[0].content.decode()).group(1)):
-                    return True
-            return False
+    def closePeer(self, peerHandle):
+        return self.atCommand('+UDCPC={}'.format(peerHandle))
 
-        elif self.__dataMode == OdinDataMode.CommandMode:
-            messageList = self.rxMessage(Message(type=None, content=b'+UUDPC'))
-            if messageList:
-                regex = re.compile('\+UUDPC:([0-9]+),')
-                if peerHandle == int(regex.search(messageList[0].content.decode()).group(1)):
-                    return True
-            return False
-        else:
-            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+    @timedPhase('peerConnected')
+    def waitforPeerConnection(self, peerHandle, timeout=None):
+        messageList = self.__waitUrc(b'+UUDPC', timeout)
+        return bool(messageList) and isinstance(messageList[0].event, OdinPeerConnected) \
+            and messageList[0].event.peerHandle == peerHandle
 
-    def waitForConnectEvent(self, peerAddr, peerPort):
+    @timedPhase('channel')
+    def waitForConnectEvent(self, peerAddr, peerPort, timeout=None):
         if self.__dataMode == OdinDataMode.ExtendedDataMode:
-            messageList = self.rxMessage(Message(type=OdinEdmMsg.ConnEv, content=None))
+            messageList = self.waitMessageList([Message(type=OdinEdmMsg.ConnEv, content=None)],
+                                               timeout or self.args.waitTimeout)
             if messageList:
-                channelId = messageList[0].content[0]
-                connectType = messageList[0].content[1]
-                protocol = messageList[0].content[2]
-                remoteAddr = str(messageList[0].content[3]) + '.' \
-                    + str(messageList[0].content[4]) + '.' \
-                    + str(messageList[0].content[5]) + '.' \
-                    + str(messageList[0].content[6])
-                remotePort = messageList[0].content[7] * 256 + messageList[0].content[8]
-                if remoteAddr == peerAddr and remotePort == peerPort:
-                    return channelId
+                event = messageList[0].event
+                if event.remoteAddr == peerAddr and event.remotePort == peerPort:
+                    return event.channelId
         return None
 
+    #raise socket.timeout if the module switched to EDM but its StartEv did not come within atTimeout
+    @timedPhase('dataMode')
     def setDataMode(self, mode):
+        if mode == self.__dataMode:
+            return True
         if self.atCommand('O{}'.format(mode.value)):
             self.__dataMode = mode
+            #bytes read along with the OK already belong to the new mode
+            remainder = self.__cmTokenizer.takeRemainder()
             if self.__dataMode == OdinDataMode.ExtendedDataMode:
-                if self.rxMessage(Message(type=OdinEdmMsg.StartEv, content=None)):
-                    return True
+                self.__rxFrames.extend(self.__feed(remainder))
+                if not self.waitMessageList([Message(type=OdinEdmMsg.StartEv, content=None)], self.atTimeout):
+                    raise socket.timeout('No StartEv within {} s of switching to {}'.format(self.atTimeout, mode.name))
+                return True
         return False
             
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+#socket-like stream over one EDM channel, created by OdinChannelManager.open
+class OdinChannel:
+    def __init__(self, manager, client, channelId, peerHandle, protocol, remoteAddr, remotePort):
+        self.channelId = channelId
+        self.peerHandle = peerHandle
+        self.protocol = protocol
+        self.remoteAddr = remoteAddr
+        self.remotePort = remotePort
+        self.timeout = None
+        self.closed = False
+        self.disconnected = False
+        self.txFragments = collections.deque()
+        self.txPending = 0
+        self.__manager = manager
+        self.__client = client
+        self.__rxBuffer = client.dataBuffer(channelId)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, data):
+        if self.closed or self.disconnected:
+            raise ConnectionError('Channel {} is closed'.format(self.channelId))
+        self.__manager.txChannel(self, data)
+        return len(data)
+
+    def sendall(self, data):
+        self.send(data)
+
+    def recv(self, bufsize):
+        data = self.__rxBuffer.read(bufsize, self.timeout)
+        if data is None:
+            raise socket.timeout('timed out')
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        if nbytes:
+            buffer = memoryview(buffer)[:nbytes]
+        nbytes = self.__rxBuffer.readinto(buffer, self.timeout)
+        if nbytes is None:
+            raise socket.timeout('timed out')
+        return nbytes
+
+    #return a memoryview of received data without copying it, call consume() once done with it
+    def recvView(self):
+        view = self.__rxBuffer.peek(self.timeout)
+        if view is None:
+            raise socket.timeout('timed out')
+        return view
+
+    def consume(self, nbytes):
+        self.__rxBuffer.consume(nbytes)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.__manager.closeChannel(self)
+
+#opens several peer connections over one EDM link and interleaves their TX frames round robin
+class OdinChannelManager:
+    def __init__(self, client):
+        self.__client = client
+        self.__channels = {}
+        self.__openLock = threading.Lock()
+        self.__txCond = threading.Condition()
+        self.__txReady = collections.deque()
+        self.__txBusy = False
+        self.__opening = False
+        client.subscribe(OdinEdmMsg.ConnEv, self.__onConnect)
+        client.subscribe(OdinEdmMsg.DiscEv, self.__onDisconnect)
+        client.startReader()
+
+    @property
+    def channels(self):
+        return dict(self.__channels)
+
+    #return OdinChannel or None if connecting failed or timed out
+    def open(self, peerAddr, peerPort, protocol='tcp', timeout=None):
+        remoteAddr = socket.gethostbyname(peerAddr)
+        #ConnEv does not carry the peer handle, opens are serialized so that it can be matched by the remote end
+        with self.__openLock:
+            self.__opening = True
+            try:
+                peerHandle = self.__client.connectToPeer(peerAddr, peerPort, protocol)
+                if peerHandle is None:
+                    return None
+                connEv = Message(type=OdinEdmMsg.ConnEv,
+                                 content=socket.inet_aton(remoteAddr) + struct.pack('>H', peerPort))
+                start = time.perf_counter()
+                messageList = self.__client.rxEvent([connEv], timeout)
+                self.__client.stats.addPhase('channel', time.perf_counter() - start)
+            finally:
+                self.__opening = False
+            if not messageList:
+                self.__client.closePeer(peerHandle)
+                return None
+            channel = OdinChannel(self, self.__client, messageList[0].event.channelId, peerHandle, protocol, remoteAddr,
+                                  peerPort)
+            self.__channels[channel.channelId] = channel
+            return channel
+
+    def closeChannel(self, channel):
+        if not channel.disconnected:
+            self.__client.closePeer(channel.peerHandle)
+        if self.__channels.get(channel.channelId) is channel:
+            del self.__channels[channel.channelId]
+
+    #close the channels left open and stop taking the events of the client, which keeps running
+    def close(self):
+        for channel in list(self.__channels.values()):
+            channel.close()
+        self.__client.unsubscribe(OdinEdmMsg.ConnEv, self.__onConnect)
+        self.__client.unsubscribe(OdinEdmMsg.DiscEv, self.__onDisconnect)
+
+    #a ConnEv that comes after its open gave up is taken here, it would match the next open to the same peer
+    def __onConnect(self, message):
+        return not self.__opening
+
+    def __onDisconnect(self, message):
+        channel = self.__channels.get(message.event.channelId)
+        if channel is not None:
+            channel.disconnected = True
+        return True
+
+    #queue data of the channel as EDM sized fragments and write them one frame per channel in turn,
+    #whichever sender finds the link idle writes the frames of all the others too, coalesced per round
+    def txChannel(self, channel, data):
+        data = memoryview(data)
+        with self.__txCond:
+            channel.txFragments.extend([data[i:i + OdinEdmMaxDataLen] for i in range(0, len(data), OdinEdmMaxDataLen)])
+            if channel not in self.__txReady:
+                self.__txReady.append(channel)
+            #the fragments reference the caller's buffer, so wait until they are written and not just dequeued
+            while channel.txFragments or channel.txPending:
+                if self.__txBusy:
+                    self.__txCond.wait()
+                    continue
+                self.__txBusy = True
+                try:
+                    while self.__txReady:
+                        batch = [(x, x.txFragments.popleft()) for x in self.__txReady]
+                        self.__txReady = collections.deque([x for x in self.__txReady if x.txFragments])
+                        for txChannel, fragment in batch:
+                            txChannel.txPending += 1
+                        self.__txCond.release()
+                        try:
+                            for txChannel, fragment in batch:
+                                self.__client.txData(fragment, txChannel.channelId, flush=False)
+                            self.__client.flushTx()
+                        finally:
+                            self.__txCond.acquire()
+                            for txChannel, fragment in batch:
+                                txChannel.txPending -= 1
+                finally:
+                    self.__txBusy = False
+                    self.__txCond.notify_all()
+
+#how far the link of an OdinConnection is up, each state needs the ones below it
+class OdinLinkState(IntEnum):
+    Radio = 0
+    Wifi = 1
+    Network = 2
+    Channel = 3
+
+#keeps one channel to peerAddr:peerPort up over an OdinClient with the reader thread running, the received
+#events move the state down when a link is lost and a supervisor thread brings it back up from there with
+#exponential backoff, senders and receivers wait out an outage for up to outageTimeout seconds
+class OdinConnection:
+    def __init__(self, client, peerAddr, peerPort, protocol='tcp', configId=OdinDefaultConfigId, interfaceId=0):
+        args = client.args
+        self.peerAddr = peerAddr
+        self.peerPort = peerPort
+        self.protocol = protocol
+        self.configId = configId
+        self.interfaceId = interfaceId
+        self.waitTimeout = args.waitTimeout
+        self.outageTimeout = args.outageTimeout
+        self.reconnectDelay = args.reconnectDelay
+        self.reconnectMaxDelay = args.reconnectMaxDelay
+        self.timeout = None
+        self.stats = client.stats
+        self.__client = client
+        self.__manager = OdinChannelManager(client)
+        self.__cond = threading.Condition()
+        self.__channel = None
+        self.__closed = False
+        self.__outageStart = time.monotonic()
+        self.__networkUps = 0
+        #the callbacks may run before isNetworkUp returns
+        self.state = OdinLinkState.Radio
+        client.subscribe(OdinEdmMsg.AtEv, self.__onAtEv)
+        client.subscribe(OdinEdmMsg.DiscEv, self.__onDiscEv)
+        if client.isNetworkUp(interfaceId):
+            self.__reach(OdinLinkState.Network)
+        self.__supervisor = threading.Thread(target=self.__supervise, name='odin-connection', daemon=True)
+        self.__supervisor.start()
+
+    #event callbacks run on the reader thread and only move the state, the AT commands are left to the supervisor,
+    #the link belongs to the connection so it takes all the URCs and nothing waits for them in the event queue
+    def __onAtEv(self, message):
+        event = message.event
+        if isinstance(event, OdinWifiLinkConnected):
+            self.__reach(OdinLinkState.Wifi)
+        elif isinstance(event, OdinNetworkUp) and event.interfaceId == self.interfaceId:
+            #the first one is for the IPv6 link local address, the supervisor checks for the IPv4 address
+            with self.__cond:
+                self.__networkUps += 1
+                self.__cond.notify_all()
+        elif isinstance(event, OdinWifiLinkDisconnected):
+            self.__lose(OdinLinkState.Radio, 'Wi-Fi link lost')
+        elif isinstance(event, OdinNetworkDown) and event.interfaceId == self.interfaceId:
+            self.__lose(OdinLinkState.Wifi, 'network {} down'.format(self.interfaceId))
+        elif isinstance(event, OdinPeerDisconnected):
+            channel = self.__channel
+            if channel is not None and event.peerHandle == channel.peerHandle:
+                self.__lose(OdinLinkState.Network, 'peer {} disconnected'.format(event.peerHandle), channel)
+        return True
+
+    def __onDiscEv(self, message):
+        channel = self.__channel
+        if channel is not None and message.event.channelId == channel.channelId:
+            self.__lose(OdinLinkState.Network, 'channel {} disconnected'.format(channel.channelId), channel)
+        return True
+
+    def __reach(self, state):
+        with self.__cond:
+            if self.state < state:
+                self.state = state
+                self.__cond.notify_all()
+
+    #channel is the one that was lost, nothing happens if it has been replaced already
+    def __lose(self, state, reason, channel=None):
+        with self.__cond:
+            if channel is not None and channel is not self.__channel:
+                return
+            if self.state <= state:
+                return
+            if self.state == OdinLinkState.Channel:
+                self.__outageStart = time.monotonic()
+            self.state = state
+            self.__cond.notify_all()
+        if self.__client.tracer.info:
+            self.__client.tracer.log('{}, link down to {}'.format(reason, state.name))
+
+    def __supervise(self):
+        delay = self.reconnectDelay
+        retry = False
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__closed or self.state < OdinLinkState.Channel)
+                if self.__closed:
+                    return
+                state = self.state
+            if self.__bringUp(state, retry):
+                delay = self.reconnectDelay
+                retry = False
+                continue
+            retry = True
+            backoff = delay * random.uniform(0.5, 1.0)
+            if self.__client.tracer.info:
+                self.__client.tracer.log('bringing the link up from {} failed, retry in {:.2f} s'.format(state.name, backoff))
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__closed, backoff)
+            delay = min(delay * 2, self.reconnectMaxDelay)
+
+    #return True once the state moved up to at least state, False if the deadline passed or it was closed
+    def __waitState(self, state, timeout):
+        with self.__cond:
+            return self.__cond.wait_for(lambda: self.__closed or self.state >= state, timeout) and not self.__closed
+
+    #the config is activated only from Radio, otherwise the module is still on it or reconnecting by itself
+    @timedPhase('wifi')
+    def __waitWifi(self, state, timeout):
+        if state == OdinLinkState.Radio:
+            self.__client.activateWifiConfig(self.configId)
+        return self.__waitState(OdinLinkState.Wifi, timeout)
+
+    #return True once the interface has its IPv4 address, checked again on every +UUNU until the deadline
+    @timedPhase('network')
+    def __waitNetwork(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.__cond:
+                if self.__closed or self.state < OdinLinkState.Wifi:
+                    return False
+                if self.state >= OdinLinkState.Network:
+                    return True
+                networkUps = self.__networkUps
+            if self.__client.isNetworkUp(self.interfaceId):
+                self.__reach(OdinLinkState.Network)
+                return True
+            with self.__cond:
+                if not self.__cond.wait_for(lambda: self.__closed or self.state < OdinLinkState.Wifi
+                                            or self.__networkUps != networkUps, deadline - time.monotonic()):
+                    return False
+
+    #every step has waitTimeout seconds and is timed as a phase of its own, peer and channel by the manager, an old
+    #channel is closed before a new one is opened, a retry restarts the Wi-Fi config in case the module got stuck
+    #on its own reconnect
+    @timedPhase('linkUp')
+    def __bringUp(self, state, retry):
+        self.__closeChannel()
+        if retry and state < OdinLinkState.Network:
+            with self.__cond:
+                self.state = state = OdinLinkState.Radio
+            self.__client.deactivateWifiConfig(self.configId)
+        if not self.__waitWifi(state, self.waitTimeout):
+            return False
+        if not self.__waitNetwork(self.waitTimeout):
+            return False
+        channel = self.__manager.open(self.peerAddr, self.peerPort, self.protocol, self.waitTimeout)
+        if channel is None:
+            return False
+        with self.__cond:
+            if self.__closed or self.state < OdinLinkState.Network:
+                lost = True
+            else:
+                lost = False
+                self.__channel = channel
+                self.state = OdinLinkState.Channel
+                outage = time.monotonic() - self.__outageStart
+                self.__cond.notify_all()
+        if lost:
+            channel.close()
+            return False
+        self.stats.addPhase('outage', outage)
+        if self.__client.tracer.info:
+            self.__client.tracer.log('link up on channel {} after {:.3f} s'.format(channel.channelId, outage))
+        return True
+
+    def __closeChannel(self):
+        with self.__cond:
+            channel = self.__channel
+            self.__channel = None
+        if channel is not None:
+            channel.close()
+
+    #return True if the link is up within timeout
+    def waitConnected(self, timeout=None):
+        return self.__waitState(OdinLinkState.Channel, timeout)
+
+    #return the channel, waiting for the link to come back until the outage has lasted outageTimeout seconds
+    def __currentChannel(self):
+        with self.__cond:
+            while not self.__closed and self.state < OdinLinkState.Channel:
+                remaining = self.__outageStart + self.outageTimeout - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionError('Link to {}:{} down for {} s'.format(self.peerAddr, self.peerPort,
+                                                                              self.outageTimeout))
+                self.__cond.wait(remaining)
+            if self.__closed:
+                raise ConnectionError('Connection to {}:{} is closed'.format(self.peerAddr, self.peerPort))
+            return self.__channel
+
+    #data is sent again on the next channel if the channel was found lost before any of it went out
+    def sendall(self, data):
+        while True:
+            channel = self.__currentChannel()
+            try:
+                channel.sendall(data)
+                return
+            except ConnectionError:
+                self.__lose(OdinLinkState.Network, 'channel {} closed'.format(channel.channelId), channel)
+
+    #default timeout of recv and recv_into, None waits for as long as the link may be down
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    #return up to bufsize bytes, data in flight when a link was lost is gone, raise socket.timeout if nothing
+    #arrived within timeout
+    def recv(self, bufsize, timeout=None, pollInterval=0.5):
+        return self.__recv(lambda channel: channel.recv(bufsize), timeout, pollInterval)
+
+    #return the number of bytes received into buffer, same as recv otherwise
+    def recv_into(self, buffer, nbytes=0, timeout=None, pollInterval=0.5):
+        return self.__recv(lambda channel: channel.recv_into(buffer, nbytes), timeout, pollInterval)
+
+    def __recv(self, receive, timeout, pollInterval):
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            channel = self.__currentChannel()
+            wait = pollInterval if deadline is None else min(pollInterval, deadline - time.monotonic())
+            if wait <= 0:
+                raise socket.timeout('timed out')
+            channel.settimeout(wait)
+            try:
+                result = receive(channel)
+            except socket.timeout:
+                continue
+            if result:
+                return result
+            self.__lose(OdinLinkState.Network, 'channel {} closed'.format(channel.channelId), channel)
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+        if self.__supervisor is not threading.current_thread():
+            self.__supervisor.join()
+        self.__closeChannel()
+        self.__manager.close()
+        self.__client.unsubscribe(OdinEdmMsg.AtEv, self.__onAtEv)
+        self.__client.unsubscribe(OdinEdmMsg.DiscEv, self.__onDiscEv)
+
+#asyncio flavour of OdinClient, the serial port is read from the event loop so no thread is blocked
+class AsyncOdinClient:
+    def __init__(self, args):
+        self.args = args
+        self.__serial = serial.Serial(args.device, OdinDefaultBaudrate, timeout=0)
+        self.tracer = OdinTracer(OdinTraceLevel[args.trace], args.traceRing)
+        if self.tracer.info:
+            self.tracer.log('connected to {}'.format(self.__serial.name))
+        self.__capture = OdinCapture(args.capture) if args.capture else None
+        self.stats = OdinStats(self.__serial.name)
+        self.__read(self.__serial.in_waiting)
+
+        self.__dataMode = OdinDataMode.CommandMode
+        self.__pendingDataMode = None
+        self.__edmDecoder = OdinEdmDecoder()
+        self.__cmTokenizer = OdinCmTokenizer()
+        self.__cmLineQueue = OdinAsyncRxQueue(args.rxQueueLen)
+        self.__cmUrcQueue = OdinAsyncRxQueue(args.rxQueueLen)
+        self.__atConfQueue = OdinAsyncRxQueue(args.rxQueueLen)
+        self.__eventQueue = OdinAsyncRxQueue(args.rxQueueLen)
+        self.__atConfOwed = 0
+        self.__dataQueues = {}
+        self.__subscribers = collections.defaultdict(list)
+        self.__atLock = None
+        self.__loop = None
+        self.__txDone = None
+        self.__edmWriter = OdinEdmWriter(self.__serial, blocking=False)
+        self.__edmWriter.capture = self.__capture
+        self.stats.queues = {'cmLine': self.__cmLineQueue, 'cmUrc': self.__cmUrcQueue, 'atConf': self.__atConfQueue,
+                             'event': self.__eventQueue}
+        self.stats.channelQueues = lambda: dict(self.__dataQueues)
+        self.stats.decoder = self.__edmDecoder
+        self.stats.writer = self.__edmWriter
+        if args.stats:
+            startStatsDump(self.stats, args.stats, args.statsFormat, args.statsInterval)
+
+    def __read(self, size):
+        rxBuffer = self.__serial.read(size)
+        self.stats.readCount += 1
+        self.stats.rxBytes += len(rxBuffer)
+        if self.__capture is not None and rxBuffer:
+            self.__capture.record(OdinCaptureDirection.Rx, rxBuffer)
+        return rxBuffer
+
+    async def open(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__atLock = asyncio.Lock()
+        self.__loop.add_reader(self.__serial.fileno(), self.__onReadable)
+        #see OdinClient.__init__, the reboot goes out in the mode the module is in
+        await self.__probeMode()
+        if not await self.reboot():
+            raise Exception('Reboot failed')
+        if not await self.waitForStartup(self.args.waitTimeout):
+            raise Exception('Timed out when waiting for +STARTUP flag')
+
+    #see OdinClient.__probeSerialNumber, return True if the module answered in command mode or in EDM, leaving
+    #the client in that mode, or False and the client in command mode
+    @timedPhase('probe')
+    async def __probeMode(self, probeTimeout=0.5):
+        modes = [OdinDataMode.CommandMode, OdinDataMode.ExtendedDataMode]
+        if self.args.warmStart:
+            modes.reverse()
+        traceLevel = self.tracer.level
+        #a probe in the wrong mode fails by design, its errors are not traced
+        self.tracer.setLevel(OdinTraceLevel.Off)
+        try:
+            for mode in modes:
+                self.__serial.reset_input_buffer()
+                self.__cmTokenizer.reset()
+                self.__edmDecoder.reset()
+                self.__dataMode = mode
+                if mode == OdinDataMode.CommandMode and mode != modes[0]:
+                    await self.__probe(probeTimeout)
+                if await self.__probe(probeTimeout):
+                    return True
+        finally:
+            self.tracer.setLevel(traceLevel)
+        self.__dataMode = OdinDataMode.CommandMode
+        return False
+
+    #return True if the module answers within timeout
+    async def __probe(self, timeout):
+        if await self.atCommand('', timeout):
+            return True
+        self.__atConfOwed = 0
+        return False
+
+    def close(self):
+        if self.__loop is not None:
+            self.__loop.remove_reader(self.__serial.fileno())
+            if self.__txDone is not None:
+                self.__loop.remove_writer(self.__serial.fileno())
+                self.__txDone.cancel()
+                self.__txDone = None
+            self.__loop = None
+        if self.__capture is not None:
+            self.__capture.close()
+        self.__serial.close()
+
+    def __onReadable(self):
+        rxBuffer = self.__read(self.__serial.in_waiting or 1)
+        if not rxBuffer:
+            return
+        if self.__dataMode == OdinDataMode.CommandMode:
+            rxBuffer = self.__rxCommandMode(rxBuffer)
+        if rxBuffer and self.__dataMode == OdinDataMode.ExtendedDataMode:
+            resyncCount = self.__edmDecoder.resyncCount
+            for message in self.__edmDecoder.feed(rxBuffer):
+                self.__dispatch(message)
+            if self.__edmDecoder.resyncCount != resyncCount:
+                self.tracer.error('EDM framing lost, {} resyncs'.format(self.__edmDecoder.resyncCount))
+
+    #queue responses and final results apart from the URCs, return the bytes left over after a switch out of
+    #command mode
+    def __rxCommandMode(self, rxBuffer):
+        self.__cmTokenizer.feed(rxBuffer)
+        while True:
+            line = self.__cmTokenizer.next()
+            if line is None:
+                return None
+            if self.tracer.frames:
+                self.tracer.frame(OdinTraceKind.RxLine, line.kind.value, line.content)
+            if line.kind == OdinCmLineKind.Echo:
+                continue
+            message = Message(type=None, content=line.content, event=line.event)
+            if line.kind == OdinCmLineKind.Urc:
+                if not self.__notify(message._replace(type=OdinEdmMsg.AtEv)):
+                    self.__cmUrcQueue.put(message)
+                continue
+            self.__cmLineQueue.put(message)
+            if line.content == b'OK' and self.__pendingDataMode is not None:
+                self.__dataMode = self.__pendingDataMode
+                self.__pendingDataMode = None
+                return self.__cmTokenizer.takeRemainder()
+
+    def __dispatch(self, message):
+        if self.tracer.frames:
+            if message.type == OdinEdmMsg.DataEv:
+                self.tracer.frame(OdinTraceKind.RxData, message.content[0], memoryview(message.content)[1:])
+            else:
+                self.tracer.frame(OdinTraceKind.RxMsg, int.from_bytes(message.type.value, 'big'), message.content or b'')
+        if message.type == OdinEdmMsg.DataEv:
+            self.stats.countRxData(message.content[0], len(message.content) - 1)
+            self.dataQueue(message.content[0]).put(message)
+            return
+        self.stats.countRx(message.type, len(message.content) if message.content else 0)
+        if message.type == OdinEdmMsg.AtConf:
+            self.__atConfQueue.put(message)
+        elif not self.__notify(message):
+            self.__eventQueue.put(message)
+
+    #see OdinClient.__notify
+    def __notify(self, message):
+        return any([callback(message) for callback in list(self.__subscribers[message.type])])
+
+    def dataQueue(self, channelId):
+        if channelId not in self.__dataQueues:
+            self.__dataQueues[channelId] = OdinAsyncRxQueue(self.args.rxQueueLen)
+        return self.__dataQueues[channelId]
+
+    #see OdinClient.subscribe, callback runs on the event loop
+    def subscribe(self, msgType, callback):
+        self.__subscribers[msgType].append(callback)
+
+    def unsubscribe(self, msgType, callback):
+        self.__subscribers[msgType].remove(callback)
+
+    def __tx(self, kind, data):
+        if self.__dataMode == OdinDataMode.CommandMode:
+            self.__cmTokenizer.expectEcho(data)
+        self.stats.countTx(OdinEdmMsg.AtReq, 1, len(data) - OdinEdmFrameOverhead \
+                           if self.__dataMode == OdinDataMode.ExtendedDataMode else len(data))
+        self.stats.atCommands += 1
+        if self.tracer.frames:
+            self.tracer.frame(kind, 0, data)
+        self.__edmWriter.addFrame(data)
+        self.__flush()
+
+    #write what the port takes now and the rest from the event loop once the port is writable
+    def __flush(self):
+        if not self.__edmWriter.flush() and self.__txDone is None:
+            self.__txDone = self.__loop.create_future()
+            self.__loop.add_writer(self.__serial.fileno(), self.__onWritable)
+
+    def __onWritable(self):
+        if self.__edmWriter.flush():
+            self.__loop.remove_writer(self.__serial.fileno())
+            self.__txDone.set_result(None)
+            self.__txDone = None
+
+    #return the confirmation message of the command or None if it failed or timed out
+    async def __atCommandMessage(self, command, timeout):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode and self.__dataMode != OdinDataMode.CommandMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        timeout = timeout or self.args.atTimeout
+        async with self.__atLock:
+            while self.__atConfOwed:
+                self.__atConfOwed -= 1
+                if await self.__waitFinal(timeout) is None:
+                    self.__atConfOwed = 0
+            if self.__dataMode == OdinDataMode.ExtendedDataMode:
+                self.__tx(OdinTraceKind.TxCmd, edmFrame(OdinEdmMsg.AtReq, atRequest(command)))
+                respMsgList = await self.__waitFinal(timeout)
+                if not respMsgList:
+                    self.__atConfOwed += 1
+                    self.stats.atTimeouts += 1
+                elif b'ERROR' in respMsgList[0].content:
+                    self.stats.atErrors += 1
+                if not respMsgList or b'ERROR' in respMsgList[0].content:
+                    self.tracer.error('AT command {} failed'.format(command))
+                    return None
+                return respMsgList[0]
+            self.__tx(OdinTraceKind.TxCmd, atRequest(command))
+            response = b''
+            event = None
+            while True:
+                respMsgList = await self.__cmLineQueue.get(None, timeout)
+                if not respMsgList:
+                    self.__atConfOwed += 1
+                    self.stats.atTimeouts += 1
+                    return None
+                line = respMsgList[0].content
+                if line == b'OK':
+                    return Message(type=None, content=response, event=event)
+                if line == b'ERROR':
+                    self.stats.atErrors += 1
+                    self.tracer.error('AT command {} failed'.format(command))
+                    return None
+                response += line + OdinCmSfd
+                event = event or respMsgList[0].event
+
+    #return [Messages] with the OK or ERROR of a command or None if timed out, in command mode the lines before it
+    #are dropped, see OdinClient.__drainAtConf for the confirmations owed to commands that timed out
+    async def __waitFinal(self, timeout):
+        if self.__dataMode == OdinDataMode.ExtendedDataMode:
+            return await self.__atConfQueue.get([Message(type=OdinEdmMsg.AtConf, content=b'OK'),
+                                                 Message(type=OdinEdmMsg.AtConf, content=b'ERROR')], timeout)
+        while True:
+            respMsgList = await self.__cmLineQueue.get(None, timeout)
+            if not respMsgList or respMsgList[0].content in OdinCmFinalResults:
+                return respMsgList
+
+    #return the response of the command or None if it failed or timed out
+    async def atCommandResponse(self, command, timeout=None):
+        message = await self.__atCommandMessage(command, timeout)
+        return message.content if message is not None else None
+
+    #return the event parsed from the response of the command, None if it failed, timed out or had no known response
+    async def atCommandEvent(self, command, timeout=None):
+        message = await self.__atCommandMessage(command, timeout)
+        return message.event if message is not None else None
+
+    async def atCommand(self, command, timeout=None):
+        return await self.atCommandResponse(command, timeout) is not None
+
+    @timedPhase('reboot')
+    async def reboot(self):
+        if await self.atCommand('+CPWROFF'):
+            self.__atConfOwed = 0
+            if self.__dataMode != OdinDataMode.CommandMode:
+                self.__cmTokenizer.reset()
+            self.__dataMode = OdinDataMode.CommandMode
+            self.__edmDecoder.reset()
+            return True
+        return False
+
+    @timedPhase('startup')
+    async def waitForStartup(self, timeout=None):
+        if self.__dataMode != OdinDataMode.CommandMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        return await self.__cmUrcQueue.get([Message(type=None, content=b'+STARTUP')], timeout) is not None
+
+    #see OdinClient.setDataMode
+    @timedPhase('dataMode')
+    async def setDataMode(self, mode, timeout=None):
+        timeout = timeout or self.args.atTimeout
+        self.__pendingDataMode = mode
+        if not await self.atCommand('O{}'.format(mode.value), timeout):
+            self.__pendingDataMode = None
+            return False
+        if mode == OdinDataMode.ExtendedDataMode \
+                and await self.__eventQueue.get([Message(type=OdinEdmMsg.StartEv, content=None)], timeout) is None:
+            raise socket.timeout('No StartEv within {} s of switching to {}'.format(timeout, mode.name))
+        return True
+
+    #timeout defaults to waitTimeout
+    async def __waitEvent(self, content, timeout):
+        timeout = timeout or self.args.waitTimeout
+        if self.__dataMode == OdinDataMode.ExtendedDataMode:
+            return await self.__eventQueue.get([Message(type=OdinEdmMsg.AtEv, content=content)], timeout)
+        elif self.__dataMode == OdinDataMode.CommandMode:
+            return await self.__cmUrcQueue.get([Message(type=None, content=content)], timeout)
+        else:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+
+    @timedPhase('wifi')
+    async def waitforWifiConnected(self, configId, timeout=None):
+        return await self.__waitEvent(b'+UUWLE', timeout) is not None
+
+    #see OdinClient.waitforNetworkUp
+    @timedPhase('network')
+    async def waitforNetworkUp(self, interfaceId, timeout=None):
+        deadline = time.monotonic() + (timeout or self.args.waitTimeout)
+        while not await self.isNetworkUp(interfaceId):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or await self.__waitEvent(b'+UUNU', remaining) is None:
+                return False
+        return True
+
+    async def isNetworkUp(self, interfaceId):
+        event = await self.atCommandEvent('+UNSTAT={},101'.format(interfaceId))
+        return isinstance(event, OdinNetworkStatus) and event.value not in OdinNoIpv4Addresses
+
+    @timedPhase('peer')
+    async def connectToPeer(self, peerAddr, peerPort, timeout=None):
+        event = await self.atCommandEvent('+UDCP="tcp://{}:{}/"'.format(peerAddr, peerPort), timeout)
+        return event.peerHandle if isinstance(event, OdinPeerHandle) else None
+
+    @timedPhase('channel')
+    async def waitForConnectEvent(self, peerAddr, peerPort, timeout=None):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        messageList = await self.__eventQueue.get([Message(type=OdinEdmMsg.ConnEv, content=None)],
+                                                  timeout or self.args.waitTimeout)
+        if messageList:
+            event = messageList[0].event
+            if event.remoteAddr == peerAddr and event.remotePort == peerPort:
+                return event.channelId
+        return None
+
+    #return once data is written to the port, it is not copied
+    async def txData(self, data, channelId):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        if self.tracer.frames:
+            self.tracer.frame(OdinTraceKind.TxData, channelId, data)
+        self.stats.countTxData(channelId, max((len(data) + OdinEdmMaxDataLen - 1) // OdinEdmMaxDataLen, 1), len(data))
+        self.__edmWriter.addData(channelId, data)
+        self.__flush()
+        #data is referenced until it is written
+        if self.__txDone is not None:
+            await asyncio.shield(self.__txDone)
+
+    #return data received on the channel or None if timed out
+    async def rxData(self, channelId, timeout=None):
+        if self.__dataMode != OdinDataMode.ExtendedDataMode:
+            raise Exception('Unsupported operation at data mode {}'.format(self.__dataMode.name))
+        data = await self.dataQueue(channelId).get(None, timeout)
+        if not data:
+            return None
+        return data[0].content[1:]
+
+    async def rxDataStream(self, channelId):
+        while True:
+            yield await self.rxData(channelId)
+
+async def asyncMain(args):
+    odinClient = AsyncOdinClient(args)
+    await odinClient.open()
+    if not await odinClient.setDataMode(OdinDataMode.ExtendedDataMode):
+        odinClient.tracer.error('Switch to {} failed'.format(OdinDataMode.ExtendedDataMode.name), True)
+        exit(-1)
+    configId = 0
+    interfaceId = 0
+    for command in wifiConfigCommands(args, configId):
+        await odinClient.atCommand(command)
+    await odinClient.atCommand('+UWSCA={},3'.format(configId))
+    if not await odinClient.waitforWifiConnected(configId, args.waitTimeout):
+        odinClient.tracer.error('Wait for WIFI link establishment failed', True)
+        exit(-2)
+    if not await odinClient.waitforNetworkUp(interfaceId, args.waitTimeout):
+        odinClient.tracer.error('Wait for network up failed', True)
+        exit(-3)
+    peerHandle = await odinClient.connectToPeer(args.host, args.port)
+    channelId = await odinClient.waitForConnectEvent(args.host, args.port, args.waitTimeout)
+    if channelId is None:
+        odinClient.tracer.error('Wait for peer connected failed', True)
+        exit(-5)
+    print('peer handle returned by UDCP:{}'.format(peerHandle))
+    dataToSend = b'P\n'
+    await odinClient.txData(dataToSend, channelId)
+    async for rxData in odinClient.rxDataStream(channelId):
+        await odinClient.txData(dataToSend, channelId)
+
+#command line options of the client, shared with the scripts driving OdinClient
+def argParser(**kwargs):
+    parser = argparse.ArgumentParser(**kwargs)
     parser.add_argument('-d', '--device', help='device (serial port)',
                         default='/dev/ttyUSB0')
+    parser.add_argument('-b', '--baudrate', help='UART baud rate negotiated with the module after startup',
+                        type=int, default=OdinDefaultBaudrate)
+    parser.add_argument('--rtscts', help='enable RTS/CTS hardware flow control', action='store_true')
     parser.add_argument('-s', '--host', help='hostname or address',
                         default='192.168.1.99')
     parser.add_argument('-p', '--port', help='port', type=int, default=25000)
@@ -394,54 +2586,79 @@ if __name__ == '__main__':
                         default='0.0.0.0')
     parser.add_argument('--ipv4gw', help='static ipv4 gateway',
                         default='0.0.0.0')
+    parser.add_argument('--rx-queue-len', dest='rxQueueLen', help='max received messages queued per type',
+                        type=int, default=64)
+    parser.add_argument('--rx-buffer-size', dest='rxBufferSize', help='bytes of received data buffered per channel',
+                        type=int, default=65536)
+    parser.add_argument('--trace', help='trace level, Frame logs every frame and Payload its bytes too',
+                        default=OdinTraceLevel.Info.name, choices=[x.name for x in OdinTraceLevel])
+    parser.add_argument('--trace-ring', dest='traceRing', type=int, default=0,
+                        help='recent frames kept in memory and dumped on a fatal error, 0 for none')
+    parser.add_argument('--capture', help='append the raw UART traffic in both directions to this file, see replay.py')
+    parser.add_argument('--warm-start', dest='warmStart', action='store_true',
+                        help='skip reboot and configuration when the module still holds what this host stored in it')
+    parser.add_argument('--start-mode', dest='startMode', help='mode the module boots into once provisioned',
+                        default=OdinDataMode.CommandMode.name,
+                        choices=[x.name for x in [OdinDataMode.CommandMode, OdinDataMode.ExtendedDataMode]])
+    parser.add_argument('--state-file', dest='stateFile', help='configuration hashes and UART settings of the modules',
+                        default=os.path.expanduser('~/.odin-w2-state.json'))
+    parser.add_argument('--stats', help='write phase timings and link counters to this file, see OdinStats')
+    parser.add_argument('--stats-format', dest='statsFormat', help='format of the stats file',
+                        default='json', choices=list(OdinStatsFormats))
+    parser.add_argument('--stats-interval', dest='statsInterval', type=float, default=10,
+                        help='seconds between stats file updates, 0 writes it only at exit')
+    parser.add_argument('--at-timeout', dest='atTimeout', type=float, default=5,
+                        help='seconds to wait for the answer to an AT command')
+    parser.add_argument('--wait-timeout', dest='waitTimeout', type=float, default=30,
+                        help='seconds to wait for startup and for each step of bringing the link up')
+    parser.add_argument('--outage-timeout', dest='outageTimeout', type=float, default=60,
+                        help='seconds a lost link may take to come back before sending and receiving fail')
+    parser.add_argument('--reconnect-delay', dest='reconnectDelay', type=float, default=0.5,
+                        help='seconds before the first retry of bringing the link up, doubled on every failure')
+    parser.add_argument('--reconnect-max-delay', dest='reconnectMaxDelay', type=float, default=30,
+                        help='longest delay between retries of bringing the link up')
+    return parser
+
+if __name__ == '__main__':
+    parser = argParser()
+    parser.add_argument('--asyncio', help='run the echo client on an asyncio event loop', action='store_true')
     args = parser.parse_args()
 
+    if args.asyncio:
+        asyncio.run(asyncMain(args))
+        exit(0)
+
     odinClient = OdinClient(args)
 
     if not odinClient.setDataMode(OdinDataMode.ExtendedDataMode):
-        print ('Switch to {} failed'.format(OdinDataMode.ExtendedDataMode.name))
+        odinClient.tracer.error('Switch to {} failed'.format(OdinDataMode.ExtendedDataMode.name), True)
         exit(-1)
+    odinClient.startReader()
 
-    odinClient.generalInfo()
-    configId = 0
-    odinClient.setWifiConfig(configId)
-    odinClient.getWifiChannelList()
-    odinClient.setWifiForceWorldMode(0)
-    odinClient.radioReboot()
-    time.sleep(0.5)
-    odinClient.setWifiChannelList([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 36, 40, 44, 48, 52, 56, 60, 64, 100, 104, 108, 112, 116, 132, 136, 140])
-    odinClient.getWifiChannelList()
-    #odinClient.setNonDiscovery()
-    #odinClient.setConnectable()
-    #odinClient.disableRoaming()
-    odinClient.activateWifiConfig(configId)
-    if not odinClient.waitforWifiConnected(configId):
-        print('Wait for WIFI link establishment failed')
-        exit(-2)
+    configId = OdinDefaultConfigId
+    if not odinClient.warm:
+        odinClient.generalInfo()
+        odinClient.getWifiChannelList()
+        odinClient.provision(configId)
+        odinClient.getWifiChannelList()
+        #odinClient.setNonDiscovery()
+        #odinClient.setConnectable()
+        #odinClient.disableRoaming()
     interfaceId = 0
-    if not odinClient.waitforNetworkUp(interfaceId):
-        print('Wait for network up failed')
-        exit(-3)
-    print(odinClient.getL3Addr(interfaceId))
-    if not odinClient.waitforNetworkUp(interfaceId):
-        print('Wait for network up failed')
-        exit(-4)
+    connection = OdinConnection(odinClient, args.host, args.port, configId=configId, interfaceId=interfaceId)
+    if not connection.waitConnected(args.outageTimeout):
+        odinClient.tracer.error('Connecting to {}:{} failed'.format(args.host, args.port), True)
+        exit(-2)
     print(odinClient.getL3Addr(interfaceId))
-    peerHandle = odinClient.connectToPeer(args.host, args.port)
-    channelId = odinClient.waitForConnectEvent(args.host, args.port)
-    connected = odinClient.waitforPeerConnection(peerHandle)
-    if not connected:
-        print('Wait for peer connected failed')
-        exit(-5)
-    print('peer handle returned by UUDPC:{}'.format(peerHandle))
     dataToSend = b'P\n'
-    while True:
-        odinClient.txData(dataToSend, channelId)
-        rxMsgList = odinClient.rxMessageList([Message(type=OdinEdmMsg.DataEv, content=None), \
-            Message(type=OdinEdmMsg.AtEv, content=None), \
-            Message(type=OdinEdmMsg.ConnEv, content=None), \
-            Message(type=OdinEdmMsg.DiscEv, content=None), \
-            Message(type=OdinEdmMsg.StartEv, content=None)])
-        dataEv = [x for x in rxMsgList if x.type == OdinEdmMsg.DataEv]
-        if dataEv:
-            rxData = dataEv[0].content[1:]
\ No newline at end of file
+    try:
+        while True:
+            connection.sendall(dataToSend)
+            try:
+                rxData = connection.recv(args.rxBufferSize, 1.0)
+            except socket.timeout:
+                #the ping was lost with a link, send another one
+                continue
+    except ConnectionError as e:
+        odinClient.tracer.error(str(e), True)
+        exit(-3)
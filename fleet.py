@@ -0,0 +1,270 @@
+#! python3
+
+import concurrent.futures
+import importlib
+import threading
+import argparse
+import datetime
+import shlex
+import socket
+import struct
+import json
+import time
+import sys
+
+odin = importlib.import_module('client-odin-w2')
+benchmark = importlib.import_module('benchmark')
+server = importlib.import_module('server')
+
+#sequence number at the head of every echo payload, echoes of pings given up on are skipped by it
+OdinFleetPingHeader = struct.Struct('!I')
+
+#trace lines of every module go to stderr prefixed by its device, stdout is left to the JSON results
+class OdinFleetTraceSink:
+    def __init__(self, device):
+        self.device = device
+
+    def write(self, text):
+        sys.stderr.write(''.join(['{} {}'.format(self.device, x) for x in text.splitlines(True)]))
+
+#return a list of per module args, the fleet file settings and the devices given on the command line on top of
+#the command line options, stats and capture files are only written for the modules that name their own
+def fleetModules(args):
+    entries = []
+    if args.fleet:
+        with open(args.fleet) as fleetFile:
+            entries += json.load(fleetFile)
+    entries += [{'device': x} for x in args.devices]
+    modules = []
+    for entry in entries:
+        for key in entry:
+            if not hasattr(args, key):
+                raise Exception('Unknown setting {} for module {}'.format(key, entry.get('device')))
+        settings = dict(vars(args), stats=None, capture=None)
+        settings.update(entry)
+        modules.append(argparse.Namespace(**settings))
+    return modules
+
+class OdinFleetModule:
+    def __init__(self, args):
+        self.args = args
+        self.client = None
+        self.connection = None
+        self.connections = 0
+        self.result = {'device': args.device, 'host': args.host, 'port': args.port, 'ssid': args.ssid,
+                       'ok': False, 'error': None}
+
+    #the bring-up sequence of client-odin-w2.py __main__, return True once the echo channel is open
+    def bringUp(self):
+        args = self.args
+        start = time.perf_counter()
+        self.client = odin.OdinClient(args, traceSink=OdinFleetTraceSink(args.device))
+        self.result['serialNumber'] = self.client.serialNumber
+        self.result['warm'] = self.client.warm
+        if not self.client.setDataMode(odin.OdinDataMode.ExtendedDataMode):
+            raise Exception('Switch to {} failed'.format(odin.OdinDataMode.ExtendedDataMode.name))
+        self.client.startReader()
+        if not self.client.warm:
+            results = self.client.provision(odin.OdinDefaultConfigId)
+            failed = [x.command for x in results if not x.ok]
+            if failed:
+                raise Exception('Provisioning failed at {}'.format(', '.join(failed)))
+        self.connection = odin.OdinConnection(self.client, args.host, args.port, configId=odin.OdinDefaultConfigId)
+        self.connections += 1
+        if not self.connection.waitConnected(args.waitTimeout):
+            raise Exception('Connecting to {}:{} failed'.format(args.host, args.port))
+        self.result['bringUp'] = time.perf_counter() - start
+        return True
+
+    #echo round trips for duration seconds, the upstream and bidirectional throughput of total bytes, then the
+    #frames of the server.py generator for downstream seconds
+    def workload(self):
+        args = self.args
+        self.result['echo'] = self.echo(args.size, args.duration, args.echoTimeout)
+        if args.total:
+            self.result['upstream'], self.result['bidirectional'] = benchmark.throughput(self.connection, args.chunk,
+                                                                                       args.total, args.echoTimeout)
+        if args.downstream:
+            self.result['downstream'] = self.downstream(args.generatePort, args.downstream, args.echoTimeout)
+
+    #return the round trip counters, a ping not echoed within timeout is counted lost and the next one is sent
+    def echo(self, size, duration, timeout):
+        size = max(size, OdinFleetPingHeader.size)
+        payload = bytearray(size)
+        buffer = bytearray(size)
+        samples = []
+        sent = 0
+        lost = 0
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            OdinFleetPingHeader.pack_into(payload, 0, sent)
+            start = time.perf_counter()
+            self.connection.sendall(bytes(payload))
+            sent += 1
+            try:
+                while True:
+                    benchmark.recvExactly(self.connection, buffer, size, timeout)
+                    if OdinFleetPingHeader.unpack_from(buffer)[0] == sent - 1:
+                        break
+            except socket.timeout:
+                lost += 1
+                continue
+            samples.append(time.perf_counter() - start)
+        return {'size': size, 'sent': sent, 'lost': lost, 'rtt': benchmark.percentiles(samples) if samples else None}
+
+    #return the downstream rate, the frames that went missing and their one way latency, which only means
+    #something with the clocks of both hosts in sync
+    def downstream(self, port, duration, timeout):
+        self.connection.close()
+        self.connection = odin.OdinConnection(self.client, self.args.host, port, configId=odin.OdinDefaultConfigId)
+        self.connections += 1
+        if not self.connection.waitConnected(self.args.waitTimeout):
+            raise Exception('Connecting to {}:{} failed'.format(self.args.host, port))
+        buffer = bytearray(65536)
+        frames = bytearray()
+        received = 0
+        samples = []
+        lost = 0
+        seq = None
+        start = time.monotonic()
+        end = start + duration
+        while time.monotonic() < end:
+            try:
+                nbytes = self.connection.recv_into(buffer, timeout=min(timeout, max(end - time.monotonic(), 0.01)))
+            except socket.timeout:
+                continue
+            received += nbytes
+            frames += memoryview(buffer)[:nbytes]
+            while len(frames) >= server.ServerFrameHeader.size:
+                length, frameSeq, sentNs = server.ServerFrameHeader.unpack_from(frames)
+                #the stream of a new channel after a reconnect starts over at sequence 0
+                if length < server.ServerFrameHeader.size or length > len(buffer):
+                    frames.clear()
+                    seq = None
+                    break
+                if len(frames) < length:
+                    break
+                samples.append((time.time_ns() - sentNs) / 1e9)
+                if seq is not None and frameSeq > seq:
+                    lost += frameSeq - seq - 1
+                seq = frameSeq
+                del frames[:length]
+        elapsed = time.monotonic() - start
+        return {'bytes': received, 'rate': received / elapsed, 'frames': len(samples), 'lost': lost,
+                'latency': benchmark.percentiles(samples) if samples else None}
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        if self.client is not None:
+            self.result['stats'] = self.client.stats.snapshot()
+            #every connection records the outage of its first bring-up too
+            outage = self.result['stats']['phases'].get('outage')
+            self.result['reconnects'] = outage['count'] - self.connections if outage is not None else 0
+            self.client.close()
+
+    #run step and record its error, return True if it went through
+    def run(self, step):
+        try:
+            step()
+            return True
+        except Exception as e:
+            self.result['error'] = '{}: {}'.format(type(e).__name__, e)
+            if self.client is not None:
+                self.client.tracer.error(self.result['error'], True)
+            return False
+
+#return the fleet totals of the module results
+def summarize(results, bringUpTime, workloadTime):
+    ok = [x for x in results if x['ok']]
+    summary = {'modules': len(results), 'ok': len(ok), 'failed': len(results) - len(ok),
+               'bringUpTime': bringUpTime, 'workloadTime': workloadTime}
+    bringUps = [x['bringUp'] for x in results if 'bringUp' in x]
+    if bringUps:
+        summary['bringUp'] = benchmark.percentiles(bringUps)
+        #what bringing the modules up one after the other would have taken
+        summary['bringUpSerial'] = sum(bringUps)
+    echoes = [x['echo'] for x in results if 'echo' in x]
+    if echoes:
+        rtts = [x['rtt'] for x in echoes if x['rtt'] is not None]
+        summary['echo'] = {'sent': sum([x['sent'] for x in echoes]), 'lost': sum([x['lost'] for x in echoes]),
+                           'p50Max': max([x['p50'] for x in rtts]) if rtts else None,
+                           'p99Max': max([x['p99'] for x in rtts]) if rtts else None}
+    for key in ['upstream', 'bidirectional']:
+        rates = [x[key] for x in results if key in x]
+        if rates:
+            summary[key] = {'total': sum(rates), 'min': min(rates), 'max': max(rates)}
+    downstreams = [x['downstream'] for x in results if 'downstream' in x]
+    if downstreams:
+        rates = [x['rate'] for x in downstreams]
+        summary['downstream'] = {'total': sum(rates), 'min': min(rates), 'max': max(rates),
+                                 'lost': sum([x['lost'] for x in downstreams])}
+    summary['reconnects'] = sum([x.get('reconnects', 0) for x in results])
+    return summary
+
+#bring every module up in parallel, run the workload on all that came up at once, then close them all
+def runFleet(args):
+    simulators = []
+    modules = fleetModules(args)
+    if args.simulate:
+        sim = importlib.import_module('simulator-odin-w2')
+        for i in range(args.simulate):
+            simArgs = ['--baudrate', str(args.simBaudrate), '--address', '192.168.1.{}'.format(50 + i),
+                       '--serial-number', '{:010d}'.format(i)] + shlex.split(args.simArgs)
+            simulator = sim.OdinSimulator(sim.argParser().parse_args(simArgs))
+            threading.Thread(target=simulator.serveForever, daemon=True).start()
+            simulators.append(simulator)
+            modules.append(argparse.Namespace(**dict(vars(args), stats=None, capture=None, device=simulator.device)))
+    if not modules:
+        raise Exception('No modules, give devices, --fleet or --simulate')
+    fleet = [OdinFleetModule(x) for x in modules]
+    results = {'timestamp': datetime.datetime.now().isoformat(), 'simulated': len(simulators)}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers or len(fleet)) as pool:
+        start = time.perf_counter()
+        up = list(pool.map(lambda x: x.run(x.bringUp), fleet))
+        bringUpTime = time.perf_counter() - start
+        start = time.perf_counter()
+        done = list(pool.map(lambda x: x.run(x.workload), [x for x, y in zip(fleet, up) if y]))
+        workloadTime = time.perf_counter() - start
+        for module, ok in zip([x for x, y in zip(fleet, up) if y], done):
+            module.result['ok'] = ok
+        list(pool.map(lambda x: x.close(), fleet))
+    for simulator in simulators:
+        simulator.shutdown()
+    results['modules'] = [x.result for x in fleet]
+    results['summary'] = summarize(results['modules'], bringUpTime, workloadTime)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(results, output, indent=2)
+    output.write('\n')
+    return results['summary']['failed'] == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(parents=[odin.argParser(add_help=False)],
+                                     description='bring up many ODIN-W2 modules in parallel and run the echo '
+                                                 'workload on all of them against server.py, the options are the '
+                                                 'defaults of every module')
+    parser.add_argument('devices', nargs='*', help='serial ports of modules using the default settings')
+    parser.add_argument('--fleet', help='JSON list of modules, each a dict of option names, e.g. '
+                                        '[{"device": "/dev/ttyUSB1", "ssid": "lab", "port": 25001}]')
+    parser.add_argument('--workers', help='modules brought up at the same time, all of them if 0',
+                        type=int, default=0)
+    parser.add_argument('--simulate', help='add this many in-process simulator-odin-w2 modules',
+                        type=int, default=0)
+    parser.add_argument('--sim-baudrate', dest='simBaudrate', help='UART baud rate emulated by the simulators',
+                        type=int, default=odin.OdinDefaultBaudrate)
+    parser.add_argument('--sim-args', dest='simArgs', help='more simulator-odin-w2 options, e.g. "--drop-interval 5"',
+                        default='')
+    parser.add_argument('--duration', help='seconds of echo round trips per module', type=float, default=10)
+    parser.add_argument('--size', help='echo payload size in bytes', type=int, default=64)
+    parser.add_argument('--echo-timeout', dest='echoTimeout', type=float, default=2,
+                        help='seconds to wait for an echo before the ping is counted lost')
+    parser.add_argument('--chunk', help='bytes per send of the throughput measurement', type=int, default=1024)
+    parser.add_argument('--total', help='bytes per throughput measurement, 0 to skip it', type=int, default=32768)
+    parser.add_argument('--downstream', help='seconds of receiving the frames of server.py --generate-port',
+                        type=float, default=0)
+    parser.add_argument('--generate-port', dest='generatePort', help='--generate-port of server.py',
+                        type=int, default=25001)
+    parser.add_argument('-o', '--output', help='JSON output file, stdout if not given')
+    parser.set_defaults(trace=odin.OdinTraceLevel.Error.name)
+    args = parser.parse_args()
+    exit(0 if runFleet(args) else 1)
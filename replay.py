@@ -0,0 +1,164 @@
+#! python3
+
+import importlib
+import collections
+import argparse
+import datetime
+import cProfile
+import pstats
+import time
+
+odin = importlib.import_module('client-odin-w2')
+
+#feeds the received bytes of a capture through the command mode tokenizer and the EDM decoder,
+#following the data mode switches the sent commands asked for
+class OdinReplayParser:
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.lineCounts = collections.Counter()
+        self.frameCounts = collections.Counter()
+        self.dataBytes = 0
+        self.__decoder = odin.OdinEdmDecoder()
+        self.__cmTokenizer = odin.OdinCmTokenizer()
+        self.__timestamp = 0
+        self.newSession()
+
+    #every client run starts over in command mode until its requests or the first bytes received show the module
+    #is in EDM, a previous run may have left it there
+    def newSession(self):
+        self.__setDataMode(odin.OdinDataMode.CommandMode)
+        self.__pendingDataMode = None
+        self.__pendingReboot = False
+        self.__modeUnknown = True
+
+    def __setDataMode(self, mode):
+        self.dataMode = mode
+        self.__decoder.reset()
+        self.__cmTokenizer.reset()
+
+    @property
+    def resyncCount(self):
+        return self.__decoder.resyncCount
+
+    def __log(self, text):
+        print('{:.6f} {}'.format(self.__timestamp / 1e9, text))
+
+    #ATO1/ATO2 take effect at their OK, after the OK of +CPWROFF the module starts over in command mode or, with
+    #an EDM start mode, with a StartEv, a client probing the module or warm started switches the framing of its
+    #requests without either
+    def tx(self, timestamp, data):
+        self.__timestamp = timestamp
+        if self.verbose:
+            self.__log('TX {}'.format(data))
+        if self.dataMode == odin.OdinDataMode.CommandMode and data.startswith(odin.OdinEdmSfd):
+            self.__modeUnknown = False
+            self.__setDataMode(odin.OdinDataMode.ExtendedDataMode)
+        elif self.dataMode == odin.OdinDataMode.ExtendedDataMode and data.startswith(b'AT'):
+            self.__setDataMode(odin.OdinDataMode.CommandMode)
+        if self.dataMode == odin.OdinDataMode.CommandMode:
+            self.__cmTokenizer.expectEcho(data)
+        if b'ATO1' in data:
+            self.__pendingDataMode = odin.OdinDataMode.DataMode
+        elif b'ATO2' in data:
+            self.__pendingDataMode = odin.OdinDataMode.ExtendedDataMode
+        if b'+CPWROFF' in data:
+            self.__pendingReboot = True
+
+    def rx(self, timestamp, data):
+        self.__timestamp = timestamp
+        while data:
+            if self.dataMode == odin.OdinDataMode.CommandMode:
+                data = self.__rxCommandMode(data)
+            elif self.dataMode == odin.OdinDataMode.ExtendedDataMode:
+                self.__rxExtendedDataMode(data)
+                data = None
+            else:
+                self.dataBytes += len(data)
+                data = None
+
+    #return the bytes left over after a switch out of command mode
+    def __rxCommandMode(self, data):
+        if self.__modeUnknown and odin.OdinEdmSfd in data:
+            start = data.index(odin.OdinEdmSfd)
+            self.__rxCommandMode(data[:start])
+            self.__modeUnknown = False
+            self.__setDataMode(odin.OdinDataMode.ExtendedDataMode)
+            return data[start:]
+        self.__cmTokenizer.feed(data)
+        while True:
+            line = self.__cmTokenizer.next()
+            if line is None:
+                return None
+            self.lineCounts[line.kind.name] += 1
+            if self.verbose:
+                self.__log('RX_LINE {} {}'.format(line.kind.name, line.content))
+            #the module boots into command mode or into EDM after the OK of +CPWROFF
+            self.__modeUnknown = line.content == b'OK' and self.__pendingReboot
+            if line.content == b'OK':
+                self.__pendingReboot = False
+                if self.__pendingDataMode is not None:
+                    self.dataMode = self.__pendingDataMode
+                    self.__pendingDataMode = None
+                    return self.__cmTokenizer.takeRemainder()
+
+    def __rxExtendedDataMode(self, data):
+        for message in self.__decoder.feed(data):
+            self.frameCounts[message.type.name] += 1
+            if message.type == odin.OdinEdmMsg.DataEv:
+                self.dataBytes += len(message.content) - 1
+            if self.verbose:
+                self.__log('RX_MSG {} {}'.format(message.type.name, message.content))
+            if message.type == odin.OdinEdmMsg.AtConf and self.__pendingReboot and b'OK' in message.content:
+                self.__pendingReboot = False
+                self.__modeUnknown = True
+                self.__setDataMode(odin.OdinDataMode.CommandMode)
+                return
+
+#replay the records once, at full speed or sleeping up to the captured time of every record
+def replay(records, parser, timing):
+    session = None
+    for recordSession, timestamp, direction, data in records:
+        if recordSession != session:
+            session = recordSession
+            parser.newSession()
+            start = time.perf_counter() - timestamp / 1e9
+        if timing:
+            delay = start + timestamp / 1e9 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if direction == odin.OdinCaptureDirection.Tx:
+            parser.tx(timestamp, data)
+        else:
+            parser.rx(timestamp, data)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='feed a capture written by client-odin-w2.py --capture through the parsers')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--timing', help='keep the captured timing instead of replaying at full speed',
+                        action='store_true')
+    parser.add_argument('--repeat', help='replay the capture this many times', type=int, default=1)
+    parser.add_argument('--profile', help='print the functions taking the most time', action='store_true')
+    parser.add_argument('-v', '--verbose', help='print every line and frame', action='store_true')
+    args = parser.parse_args()
+
+    records = list(odin.readCapture(args.capture))
+    sessions = sorted(set([x[0] for x in records]))
+    for session in sessions:
+        print('session started {}'.format(datetime.datetime.fromtimestamp(session / 1e9)))
+    rxBytes = sum([len(x[3]) for x in records if x[2] == odin.OdinCaptureDirection.Rx])
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        replayParser = OdinReplayParser(args.verbose)
+        if profiler is not None:
+            profiler.enable()
+        replay(records, replayParser, args.timing)
+        if profiler is not None:
+            profiler.disable()
+    elapsed = time.perf_counter() - start
+    print('{} records, {} bytes received, lines {}, frames {}, {} data bytes, {} resyncs'.format(
+            len(records), rxBytes, dict(replayParser.lineCounts), dict(replayParser.frameCounts), replayParser.dataBytes,
+            replayParser.resyncCount))
+    print('replayed {} times in {:.3f} s, {:.2f} MB/s'.format(args.repeat, elapsed, rxBytes * args.repeat / elapsed / 1e6))
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
@@ -1,29 +1,303 @@
 #! python3
 
-import socketserver
+import collections
+import selectors
 import datetime
 import argparse
+import socket
+import struct
+import time
 
-class tcpHandler(socketserver.BaseRequestHandler):
-    def handle(self):
-        print('{}, {} connected, will echo everything received'.format(
-                datetime.datetime.now(), self.request.getpeername()))
-        while True:
-            self.data = self.request.recv(1024)
-            if not self.data:
-                break
-            self.request.sendall(self.data)
-        print('{}, {} disconnected'.format(datetime.datetime.now(),
-                                           self.request.getpeername()))
-        
-if __name__ == '__main__':
+#head of every generated frame: frame length, sequence number and send time in ns since the epoch, the rest is
+#padding, a client echoing the frames back gets their round trip time counted as the connection latency
+ServerFrameHeader = struct.Struct('!IIQ')
+
+def log(text):
+    print('{}, {}'.format(datetime.datetime.now(), text), flush=True)
+
+#byte and latency counters of a TCP connection or of the datagrams of a UDP peer, latency is the time received
+#bytes waited in the server before they were echoed, or the round trip time of generated frames echoed back
+class ServerCounters:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rxBytes = 0
+        self.txBytes = 0
+        self.reads = 0
+        self.writes = 0
+        self.latencyCount = 0
+        self.latencySum = 0.0
+        self.latencyMax = 0.0
+
+    def addLatency(self, seconds):
+        self.latencyCount += 1
+        self.latencySum += seconds
+        self.latencyMax = max(self.latencyMax, seconds)
+
+    def __str__(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        text = 'rx {} bytes in {} reads {:.0f} B/s, tx {} bytes in {} writes {:.0f} B/s'.format(
+                self.rxBytes, self.reads, self.rxBytes / elapsed, self.txBytes, self.writes, self.txBytes / elapsed)
+        if self.latencyCount:
+            text += ', latency avg {:.3f} ms max {:.3f} ms'.format(self.latencySum / self.latencyCount * 1e3,
+                                                                   self.latencyMax * 1e3)
+        return text
+
+class ServerConnection:
+    def __init__(self, sock, generate):
+        self.sock = sock
+        self.peer = sock.getpeername()
+        self.generate = generate
+        self.counters = ServerCounters()
+        #chunks waiting to be sent with the time they were received or generated
+        self.txQueue = collections.deque()
+        self.txQueued = 0
+        self.rxFrames = bytearray()
+        self.seq = 0
+        self.nextFrame = time.monotonic()
+        self.events = 0
+
+#echoes TCP, and UDP with --udp, on one selector loop, connections to --generate-port get timestamped frames
+#instead, as fast as they are taken or at --generate-rate
+class EchoServer:
+    def __init__(self, args):
+        self.args = args
+        self.__selector = selectors.DefaultSelector()
+        self.__connections = {}
+        self.__running = False
+        self.__listen(socket.SOCK_STREAM, args.port, self.__onAccept, False)
+        if args.generatePort:
+            self.__listen(socket.SOCK_STREAM, args.generatePort, self.__onAccept, True)
+        self.__udpPeers = {}
+        if args.udp:
+            self.__listen(socket.SOCK_DGRAM, args.port, self.__onDatagram, None)
+
+    def __listen(self, kind, port, callback, generate):
+        sock = socket.socket(socket.AF_INET, kind)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__setBuffers(sock)
+        sock.bind((self.args.host, port))
+        if kind == socket.SOCK_STREAM:
+            sock.listen(self.args.backlog)
+        sock.setblocking(False)
+        self.__selector.register(sock, selectors.EVENT_READ, lambda sock, mask: callback(sock, generate))
+        log('starting {} {} (\'{}\', {})'.format('TCP' if kind == socket.SOCK_STREAM else 'UDP',
+                                                 'generator' if generate else 'echo server', self.args.host, port))
+        return sock
+
+    #0 keeps the system default
+    def __setBuffers(self, sock):
+        if self.args.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.args.sndbuf)
+        if self.args.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.args.rcvbuf)
+
+    def __onAccept(self, listener, generate):
+        try:
+            sock, address = listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__setBuffers(sock)
+        connection = ServerConnection(sock, generate)
+        self.__connections[sock] = connection
+        self.__selector.register(sock, selectors.EVENT_READ, lambda sock, mask: self.__onConnection(connection, mask))
+        connection.events = selectors.EVENT_READ
+        log('{} connected, will {}'.format(connection.peer, 'send generated frames' if generate
+                                           else 'echo everything received'))
+        self.__updateEvents(connection)
+
+    def __close(self, connection):
+        if self.__connections.pop(connection.sock, None) is None:
+            return
+        self.__selector.unregister(connection.sock)
+        connection.sock.close()
+        log('{} disconnected, {}'.format(connection.peer, connection.counters))
+
+    def __onConnection(self, connection, mask):
+        if mask & selectors.EVENT_READ:
+            self.__onReadable(connection)
+        if mask & selectors.EVENT_WRITE and connection.sock in self.__connections:
+            self.__onWritable(connection)
+        if connection.sock in self.__connections:
+            self.__updateEvents(connection)
+
+    def __onReadable(self, connection):
+        try:
+            data = connection.sock.recv(self.args.rxBufferSize)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.__close(connection)
+            return
+        counters = connection.counters
+        counters.rxBytes += len(data)
+        counters.reads += 1
+        if connection.generate:
+            self.__rxFrames(connection, data)
+            return
+        #echo straight away, what the socket does not take now is queued
+        if not connection.txQueue:
+            try:
+                sent = connection.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.__close(connection)
+                return
+            counters.writes += 1
+            counters.txBytes += sent
+            if sent == len(data):
+                counters.addLatency(0.0)
+                return
+            data = data[sent:]
+        connection.txQueue.append((time.monotonic(), data))
+        connection.txQueued += len(data)
+
+    #frames echoed back by the client, anything else is only counted
+    def __rxFrames(self, connection, data):
+        frames = connection.rxFrames
+        frames += data
+        while len(frames) >= ServerFrameHeader.size:
+            length, seq, sentNs = ServerFrameHeader.unpack_from(frames)
+            if length < ServerFrameHeader.size or length > self.args.txLimit:
+                frames.clear()
+                return
+            if len(frames) < length:
+                return
+            connection.counters.addLatency(max(0, time.time_ns() - sentNs) / 1e9)
+            del frames[:length]
+
+    def __onWritable(self, connection):
+        counters = connection.counters
+        while connection.txQueue:
+            queued, data = connection.txQueue[0]
+            try:
+                sent = connection.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.__close(connection)
+                return
+            counters.writes += 1
+            counters.txBytes += sent
+            connection.txQueued -= sent
+            if sent < len(data):
+                connection.txQueue[0] = (queued, data[sent:])
+                return
+            connection.txQueue.popleft()
+            if not connection.generate:
+                counters.addLatency(time.monotonic() - queued)
+
+    #reading stops while more than --tx-limit bytes wait to be echoed, so a slow reader slows its sender down
+    def __updateEvents(self, connection):
+        events = 0
+        if connection.generate or connection.txQueued < self.args.txLimit:
+            events |= selectors.EVENT_READ
+        if connection.txQueue:
+            events |= selectors.EVENT_WRITE
+        if events != connection.events:
+            connection.events = events
+            self.__selector.modify(connection.sock, events,
+                                   lambda sock, mask: self.__onConnection(connection, mask))
+
+    #queue the frames due by now, without a rate the queue is kept at --rx-buffer-size so the timestamps stay
+    #fresh, with a rate frames that found --tx-limit queued are skipped so a slow link does not build a backlog,
+    #return seconds to the next frame
+    def __generate(self, connection, now):
+        size = max(self.args.generateSize, ServerFrameHeader.size)
+        if self.args.generateRate:
+            interval = size / self.args.generateRate
+            while connection.nextFrame <= now:
+                if connection.txQueued < self.args.txLimit:
+                    self.__queueFrame(connection, size)
+                connection.nextFrame += interval
+            return connection.nextFrame - now
+        while connection.txQueued < self.args.rxBufferSize:
+            self.__queueFrame(connection, size)
+        return None
+
+    def __queueFrame(self, connection, size):
+        frame = bytearray(size)
+        ServerFrameHeader.pack_into(frame, 0, size, connection.seq, time.time_ns())
+        connection.seq = (connection.seq + 1) & 0xFFFFFFFF
+        connection.txQueue.append((time.monotonic(), frame))
+        connection.txQueued += size
+
+    def __onDatagram(self, sock, generate):
+        try:
+            data, address = sock.recvfrom(self.args.rxBufferSize)
+        except OSError:
+            return
+        counters = self.__udpPeers.get(address)
+        if counters is None:
+            counters = self.__udpPeers[address] = ServerCounters()
+            log('{} sent a first datagram, will echo every datagram received'.format(address))
+        counters.rxBytes += len(data)
+        counters.reads += 1
+        try:
+            counters.txBytes += sock.sendto(data, address)
+            counters.writes += 1
+        except OSError:
+            pass
+
+    def report(self):
+        for connection in list(self.__connections.values()):
+            log('{} {}, {}'.format(connection.peer, 'generator' if connection.generate else 'echo',
+                                   connection.counters))
+        for address, counters in self.__udpPeers.items():
+            log('{} udp, {}'.format(address, counters))
+
+    def serveForever(self):
+        self.__running = True
+        nextReport = time.monotonic() + self.args.reportInterval
+        while self.__running:
+            now = time.monotonic()
+            timeout = 0.1
+            for connection in list(self.__connections.values()):
+                if connection.generate:
+                    wait = self.__generate(connection, now)
+                    if wait is not None:
+                        timeout = min(timeout, wait)
+                    self.__updateEvents(connection)
+            if self.args.reportInterval and now >= nextReport:
+                self.report()
+                nextReport = now + self.args.reportInterval
+            for key, mask in self.__selector.select(max(0, timeout)):
+                key.data(key.fileobj, mask)
+
+    def shutdown(self):
+        self.__running = False
+
+def argParser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-s', '--host', help='hostname or address',
                         default='0.0.0.0')
     parser.add_argument('-p', '--port', help='port', type=int, default=25000)
-    args = parser.parse_args()
-    socketserver.TCPServer.allow_reuse_address = True
-    server = socketserver.TCPServer((args.host, args.port), tcpHandler)
-    print('{}, starting TCP server (\'{}\', {})'.format(
-            datetime.datetime.now(), args.host, args.port))
-    server.serve_forever()
+    parser.add_argument('--udp', help='echo UDP datagrams on the same port too', action='store_true')
+    parser.add_argument('--rx-buffer-size', dest='rxBufferSize', help='bytes read from a socket at once',
+                        type=int, default=65536)
+    parser.add_argument('--tx-limit', dest='txLimit', type=int, default=1 << 20,
+                        help='bytes queued for a connection before reading from it pauses')
+    parser.add_argument('--sndbuf', help='SO_SNDBUF of the sockets, 0 for the system default', type=int, default=0)
+    parser.add_argument('--rcvbuf', help='SO_RCVBUF of the sockets, 0 for the system default', type=int, default=0)
+    parser.add_argument('--backlog', help='pending connections the listening socket keeps', type=int, default=128)
+    parser.add_argument('--generate-port', dest='generatePort', type=int, default=0,
+                        help='port on which connections are sent timestamped frames instead of an echo, 0 for none')
+    parser.add_argument('--generate-size', dest='generateSize', help='bytes per generated frame',
+                        type=int, default=1024)
+    parser.add_argument('--generate-rate', dest='generateRate', type=float, default=0,
+                        help='generated bytes/s per connection, 0 for as fast as the connection takes them')
+    parser.add_argument('--report-interval', dest='reportInterval', type=float, default=0,
+                        help='seconds between counter reports of every connection, 0 for none')
+    return parser
+
+if __name__ == '__main__':
+    args = argParser().parse_args()
+    server = EchoServer(args)
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        server.report()
@@ -0,0 +1,477 @@
+#! python3
+
+import importlib
+import selectors
+import argparse
+import datetime
+import random
+import socket
+import time
+import tty
+import os
+import re
+
+odin = importlib.import_module('client-odin-w2')
+
+#host bytes read ahead of the emulated UART before the pty is left to fill up, like a module deasserting CTS
+OdinSimRxBacklog = 4096
+
+class OdinSimPeer:
+    def __init__(self, peerHandle, channelId, sock, remoteAddr, remotePort):
+        self.peerHandle = peerHandle
+        self.channelId = channelId
+        self.sock = sock
+        self.remoteAddr = remoteAddr
+        self.remotePort = remotePort
+
+#emulates the subset of an ODIN-W2 module used by OdinClient behind a pseudo terminal
+class OdinSimulator:
+    def __init__(self, args):
+        self.args = args
+        self.__master, self.__slave = os.openpty()
+        tty.setraw(self.__slave)
+        os.set_blocking(self.__master, False)
+        self.device = os.ttyname(self.__slave)
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__master, selectors.EVENT_READ, self.__onUart)
+        self.__uartEvents = selectors.EVENT_READ
+        self.__baudrate = args.baudrate
+        self.__txQueue = []
+        self.__txBlocked = False
+        self.__txReleaseTime = 0
+        self.__rxQueue = []
+        self.__rxReleaseTime = 0
+        self.__rxBacklog = 0
+        self.__running = False
+        self.__timers = []
+        self.__peers = {}
+        self.__nextPeerHandle = 1
+        self.__random = random.Random(args.seed)
+        #configuration kept over reboots, written by AT+UWSCA=<id>,1 and AT&W
+        self.__storedWifiConfig = {}
+        self.__storedChannelList = [1, 6, 11]
+        self.__storedStartMode = odin.OdinDataMode.CommandMode
+        self.__reset()
+        self.__scheduleLinkDrop()
+
+    def __reset(self):
+        self.__dataMode = odin.OdinDataMode.CommandMode
+        self.__echo = True
+        self.__cmBuffer = bytearray()
+        self.__edmDecoder = odin.OdinEdmDecoder()
+        self.__wifiConfig = dict(self.__storedWifiConfig)
+        self.__channelList = list(self.__storedChannelList)
+        self.__startMode = self.__storedStartMode
+        self.__networkUp = False
+        self.__wifiLinks = set()
+        for peer in list(self.__peers.values()):
+            self.__closePeer(peer, notify=False)
+
+    def __log(self, fmt, *args):
+        if self.args.verbose:
+            print('{} SIM '.format(datetime.datetime.now()) + fmt.format(*args))
+
+    def __after(self, delay, callback):
+        self.__timers.append((time.monotonic() + delay, callback))
+
+    #return when the last of size bytes queued after releaseTime goes over the emulated UART
+    def __pace(self, releaseTime, size):
+        now = time.monotonic()
+        if not self.__baudrate:
+            return now
+        return max(now, releaseTime) + size * 10 / self.__baudrate
+
+    #bytes towards the host are released at the pace of the configured baud rate
+    def __uartTx(self, data):
+        self.__txReleaseTime = self.__pace(self.__txReleaseTime, len(data))
+        self.__txQueue.append((self.__txReleaseTime, data))
+
+    #what the pty does not take while the host is not reading is written once it is writable again
+    def __flushUart(self):
+        now = time.monotonic()
+        while self.__txQueue and self.__txQueue[0][0] <= now:
+            releaseTime, data = self.__txQueue[0]
+            try:
+                written = os.write(self.__master, data)
+            except BlockingIOError:
+                written = 0
+            if written < len(data):
+                self.__txQueue[0] = (releaseTime, memoryview(data)[written:])
+                self.__txBlocked = True
+                break
+            self.__txQueue.pop(0)
+        else:
+            self.__txBlocked = False
+        self.__updateUartEvents()
+
+    def __txEdm(self, msgType, payload):
+        if self.args.loss and self.__random.random() < self.args.loss:
+            self.__log('DROP {} {}', msgType.name, payload)
+            return
+        frame = odin.edmFrame(msgType, payload)
+        if self.args.corrupt and self.__random.random() < self.args.corrupt:
+            frame = bytearray(frame)
+            frame[self.__random.randrange(len(frame))] ^= 0xFF
+            self.__log('CORRUPT {} {}', msgType.name, payload)
+        self.__uartTx(bytes(frame))
+
+    def __txResponse(self, lines, result):
+        response = b''.join([b'\r\n' + x.encode('ascii') for x in lines]) + b'\r\n' + result + b'\r\n'
+        if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+            self.__txEdm(odin.OdinEdmMsg.AtConf, response)
+        else:
+            self.__uartTx(response)
+
+    def __txEvent(self, event):
+        event = b'\r\n' + event.encode('ascii') + b'\r\n'
+        if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+            self.__txEdm(odin.OdinEdmMsg.AtEv, event)
+        else:
+            self.__uartTx(event)
+
+    #bytes from the host are processed at the pace of the configured baud rate too
+    def __onUart(self, fd):
+        if self.__txBlocked:
+            self.__flushUart()
+        if not self.__uartEvents & selectors.EVENT_READ:
+            return
+        try:
+            rxBuffer = os.read(self.__master, OdinSimRxBacklog)
+        except (BlockingIOError, OSError):
+            return
+        self.__rxReleaseTime = self.__pace(self.__rxReleaseTime, len(rxBuffer))
+        self.__rxQueue.append((self.__rxReleaseTime, rxBuffer))
+        self.__rxBacklog += len(rxBuffer)
+        self.__updateUartEvents()
+
+    #the pty is watched for reading while the backlog has room and for writing while a write is blocked
+    def __updateUartEvents(self):
+        events = (selectors.EVENT_READ if self.__rxBacklog < OdinSimRxBacklog else 0) \
+            | (selectors.EVENT_WRITE if self.__txBlocked else 0)
+        if events == self.__uartEvents:
+            return
+        if not self.__uartEvents:
+            self.__selector.register(self.__master, events, self.__onUart)
+        elif not events:
+            self.__selector.unregister(self.__master)
+        else:
+            self.__selector.modify(self.__master, events, self.__onUart)
+        self.__uartEvents = events
+
+    def __processUart(self):
+        now = time.monotonic()
+        while self.__rxQueue and self.__rxQueue[0][0] <= now:
+            rxBuffer = self.__rxQueue.pop(0)[1]
+            self.__rxBacklog -= len(rxBuffer)
+            self.__onUartRx(rxBuffer)
+        self.__updateUartEvents()
+
+    def __onUartRx(self, rxBuffer):
+        if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+            for message in self.__edmDecoder.feed(rxBuffer):
+                self.__onEdmMessage(message)
+            return
+        if self.__echo:
+            self.__uartTx(rxBuffer)
+        self.__cmBuffer += rxBuffer
+        while self.__dataMode == odin.OdinDataMode.CommandMode:
+            eol = self.__cmBuffer.find(b'\r')
+            if eol < 0:
+                break
+            command = bytes(self.__cmBuffer[:eol]).strip()
+            del self.__cmBuffer[:eol + 1]
+            if command:
+                self.__onAtCommand(command.decode('ascii', errors='replace'))
+        if self.__dataMode == odin.OdinDataMode.ExtendedDataMode and self.__cmBuffer:
+            for message in self.__edmDecoder.feed(self.__cmBuffer):
+                self.__onEdmMessage(message)
+            del self.__cmBuffer[:]
+
+    def __onEdmMessage(self, message):
+        self.__log('RX {} {}', message.type.name, message.content)
+        if message.type == odin.OdinEdmMsg.AtReq:
+            self.__onAtCommand(message.content.decode('ascii').strip())
+        elif message.type == odin.OdinEdmMsg.DataCmd:
+            peer = self.__peerByChannel(message.content[0])
+            if peer is not None:
+                peer.sock.sendall(message.content[1:])
+
+    def __onAtCommand(self, command):
+        self.__log('AT {}', command)
+        if not command.upper().startswith('AT'):
+            self.__txResponse([], b'ERROR')
+            return
+        command = command[2:]
+        handler = None
+        for pattern, method in self.__atHandlers:
+            match = pattern.fullmatch(command)
+            if match:
+                handler = method
+                break
+        if handler is None:
+            self.__txResponse([], b'OK')
+            return
+        try:
+            lines = handler(self, *match.groups())
+        except Exception as e:
+            self.__log('AT {} failed {}', command, e)
+            lines = None
+        if lines is None:
+            self.__txResponse([], b'ERROR')
+        else:
+            self.__txResponse(lines, b'OK')
+
+    #the module boots into the stored start mode and connects the stored Wi-Fi configs marked active on startup
+    def __atPowerOff(self):
+        def startup():
+            self.__reset()
+            if self.__startMode == odin.OdinDataMode.ExtendedDataMode:
+                self.__dataMode = odin.OdinDataMode.ExtendedDataMode
+                self.__txEdm(odin.OdinEdmMsg.StartEv, b'')
+            else:
+                self.__uartTx(b'\r\n+STARTUP\r\n')
+            for configId, tag in list(self.__wifiConfig):
+                if tag == 0 and self.__wifiConfig[(configId, tag)] == '1':
+                    self.__connectWifi(configId)
+        self.__after(self.args.startupDelay, startup)
+        return []
+
+    def __atStore(self):
+        self.__storedChannelList = list(self.__channelList)
+        self.__storedStartMode = self.__startMode
+        return []
+
+    def __atStartMode(self, mode):
+        if mode == '?':
+            return ['+UMSM:{}'.format(self.__startMode.value)]
+        self.__startMode = odin.OdinDataMode(int(mode[1:]))
+        return []
+
+    def __atEcho(self, on):
+        self.__echo = on == '1'
+        return []
+
+    def __atDataMode(self, mode):
+        if odin.OdinDataMode(int(mode)) != odin.OdinDataMode.ExtendedDataMode:
+            return None
+        def start():
+            self.__dataMode = odin.OdinDataMode.ExtendedDataMode
+            self.__txEdm(odin.OdinEdmMsg.StartEv, b'')
+        self.__after(0, start)
+        return []
+
+    def __atInfo(self, command):
+        if command.upper() in ['+CGSN', '+GSN']:
+            return [self.args.serialNumber]
+        return [self.__infoLines.get(command.upper(), 'ODIN-W2')]
+
+    #without a value the tag is read back, as it was written
+    def __atWifiConfig(self, configId, tag, value):
+        if value is None:
+            return ['+UWSC:{},{},{}'.format(configId, tag, self.__wifiConfig.get((int(configId), int(tag)), ''))]
+        self.__wifiConfig[(int(configId), int(tag))] = value
+        return []
+
+    def __atChannelList(self, channels):
+        if channels == '?':
+            return ['+UWCL:' + ','.join([str(x) for x in self.__channelList])]
+        self.__channelList = [int(x) for x in channels[1:].split(',')]
+        return []
+
+    def __connectWifi(self, configId):
+        def linkUp():
+            self.__wifiLinks.add(configId)
+            self.__txEvent('+UUWLE:{},0012F3000001,6'.format(configId))
+        def networkUp():
+            if configId in self.__wifiLinks:
+                self.__networkUp = True
+                self.__txEvent('+UUNU:0')
+        self.__after(self.args.wifiDelay, linkUp)
+        #network up is reported once for the ipv6 link local address and once for the ipv4 lease
+        self.__after(self.args.wifiDelay, lambda: self.__txEvent('+UUNU:0'))
+        self.__after(self.args.wifiDelay + self.args.dhcpDelay, networkUp)
+
+    def __atWifiAction(self, configId, action):
+        if action == '1':
+            configId = int(configId)
+            for key in [x for x in self.__storedWifiConfig if x[0] == configId]:
+                del self.__storedWifiConfig[key]
+            self.__storedWifiConfig.update([x for x in self.__wifiConfig.items() if x[0][0] == configId])
+        elif action == '3':
+            self.__connectWifi(configId)
+        elif action == '4':
+            self.__after(0, lambda: self.__dropWifi(int(configId), 3))
+        return []
+
+    #the peers go down with the link, each with a DiscEv and +UUDPD
+    def __dropWifi(self, configId, reason):
+        for peer in list(self.__peers.values()):
+            self.__closePeer(peer)
+        if self.__networkUp:
+            self.__networkUp = False
+            self.__txEvent('+UUND:0')
+        self.__wifiLinks.discard(configId)
+        self.__txEvent('+UUWLD:{},{}'.format(configId, reason))
+
+    def __scheduleLinkDrop(self):
+        if self.args.dropInterval:
+            self.__after(self.__random.expovariate(1 / self.args.dropInterval), self.__dropLink)
+
+    #take down the Wi-Fi link with probability dropWifi, one of the peers otherwise
+    def __dropLink(self):
+        if self.__random.random() < self.args.dropWifi:
+            for configId in list(self.__wifiLinks):
+                self.__log('dropping Wi-Fi link {}', configId)
+                self.__dropWifi(configId, 2)
+        elif self.__peers:
+            peer = self.__random.choice(list(self.__peers.values()))
+            self.__log('dropping peer {}', peer.peerHandle)
+            self.__closePeer(peer)
+        self.__scheduleLinkDrop()
+
+    #status 1 is the interface status, the others answer the address, 0.0.0.0 until the ipv4 lease
+    def __atNetworkStatus(self, interfaceId, statusId):
+        if statusId == '1':
+            return ['+UNSTAT:{},{},{}'.format(interfaceId, statusId, int(self.__networkUp))]
+        return ['+UNSTAT:{},{},{}'.format(interfaceId, statusId, self.args.address if self.__networkUp else '0.0.0.0')]
+
+    def __atConnectPeer(self, protocol, host, port):
+        if not self.__networkUp:
+            return None
+        sockType = socket.SOCK_STREAM if protocol == 'tcp' else socket.SOCK_DGRAM
+        sock = socket.socket(socket.AF_INET, sockType)
+        sock.connect((host, int(port)))
+        remoteAddr, remotePort = sock.getpeername()
+        peer = OdinSimPeer(self.__nextPeerHandle, self.__freeChannel(), sock, remoteAddr, remotePort)
+        self.__nextPeerHandle += 1
+        self.__peers[peer.peerHandle] = peer
+        #the peer is read from only once ConnEv is queued, what a server sends on accept must not overtake it
+        def connected():
+            if self.__peers.get(peer.peerHandle) is not peer:
+                return
+            if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+                self.__txEdm(odin.OdinEdmMsg.ConnEv, bytes([peer.channelId, 0x02, 0x00 if protocol == 'tcp' else 0x01])
+                             + socket.inet_aton(remoteAddr) + remotePort.to_bytes(2, 'big')
+                             + socket.inet_aton(self.args.address) + sock.getsockname()[1].to_bytes(2, 'big'))
+            self.__txEvent('+UUDPC:{},2,{},{},{},{},{}'.format(peer.peerHandle, 6 if protocol == 'tcp' else 17,
+                           self.args.address, sock.getsockname()[1], remoteAddr, remotePort))
+            self.__selector.register(sock, selectors.EVENT_READ, lambda fd: self.__onPeer(peer))
+        self.__after(0, connected)
+        return ['+UDCP:{}'.format(peer.peerHandle)]
+
+    def __atClosePeer(self, peerHandle):
+        peer = self.__peers.get(int(peerHandle))
+        if peer is None:
+            return None
+        self.__after(0, lambda: self.__closePeer(peer))
+        return []
+
+    def __atUartSettings(self, baudrate, flowControl, rest):
+        def apply():
+            if self.__baudrate:
+                self.__baudrate = int(baudrate)
+        self.__after(0, apply)
+        return []
+
+    __infoLines = {'+CGMI': 'u-blox', '+GMI': 'u-blox', '+CGMM': 'ODIN-W2', '+GMM': 'ODIN-W2',
+                   '+CGMR': '7.0.0', '+CGSN': '0000000000', '+GSN': '0000000000', 'I0': 'ODIN-W262',
+                   'I9': '7.0.0,simulator', 'I10': 'simulator', '+CSGT?': '+CSGT:1,"simulator"'}
+
+    __atHandlers = [(re.compile(r'\+CPWROFF'), __atPowerOff),
+                    (re.compile(r'E([01])'), __atEcho),
+                    (re.compile(r'O([0-9])'), __atDataMode),
+                    (re.compile(r'(\+C?G[MS][IMRN]|I[0-9]+|\+CSGT\?)', re.IGNORECASE), __atInfo),
+                    (re.compile(r'\+UWSC=([0-9]+),([0-9]+)(?:,(.*))?'), __atWifiConfig),
+                    (re.compile(r'\+UWCL(\?|=[0-9,]+)'), __atChannelList),
+                    (re.compile(r'\+UWSCA=([0-9]+),([0-9]+)'), __atWifiAction),
+                    (re.compile(r'\+UNSTAT=([0-9]+),([0-9]+)'), __atNetworkStatus),
+                    (re.compile(r'\+UDCP="(tcp|udp)://([^:/]+):([0-9]+)/?"'), __atConnectPeer),
+                    (re.compile(r'\+UDCPC=([0-9]+)'), __atClosePeer),
+                    (re.compile(r'\+UMRS=([0-9]+),([0-9]+)(.*)'), __atUartSettings),
+                    (re.compile(r'\+UMSM(\?|=[0-9])'), __atStartMode),
+                    (re.compile(r'&W'), __atStore)]
+
+    def __freeChannel(self):
+        used = set([x.channelId for x in self.__peers.values()])
+        return min(set(range(len(used) + 1)) - used)
+
+    def __peerByChannel(self, channelId):
+        for peer in self.__peers.values():
+            if peer.channelId == channelId:
+                return peer
+        return None
+
+    def __onPeer(self, peer):
+        try:
+            data = peer.sock.recv(odin.OdinEdmMaxDataLen)
+        except OSError:
+            data = b''
+        if not data:
+            self.__closePeer(peer)
+            return
+        if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+            self.__txEdm(odin.OdinEdmMsg.DataEv, bytes([peer.channelId]) + data)
+
+    def __closePeer(self, peer, notify=True):
+        if self.__peers.pop(peer.peerHandle, None) is None:
+            return
+        if peer.sock in self.__selector.get_map():
+            self.__selector.unregister(peer.sock)
+        peer.sock.close()
+        if notify:
+            if self.__dataMode == odin.OdinDataMode.ExtendedDataMode:
+                self.__txEdm(odin.OdinEdmMsg.DiscEv, bytes([peer.channelId]))
+            self.__txEvent('+UUDPD:{},2'.format(peer.peerHandle))
+
+    def __runTimers(self):
+        now = time.monotonic()
+        due = [x for x in self.__timers if x[0] <= now]
+        self.__timers = [x for x in self.__timers if x[0] > now]
+        for x in sorted(due, key=lambda x: x[0]):
+            x[1]()
+
+    def serveForever(self):
+        self.__running = True
+        while self.__running:
+            self.__runTimers()
+            self.__processUart()
+            self.__flushUart()
+            #a blocked write waits for the pty instead
+            txQueue = self.__txQueue[:1] if not self.__txBlocked else []
+            deadlines = [x[0] for x in self.__timers] + [x[0] for x in txQueue + self.__rxQueue[:1]]
+            #wake up now and then so that shutdown() from another thread is noticed
+            timeout = max(0, min(deadlines + [time.monotonic() + 0.1]) - time.monotonic())
+            for key, mask in self.__selector.select(timeout):
+                key.data(key.fileobj)
+
+    def shutdown(self):
+        self.__running = False
+
+def argParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baudrate', help='emulated UART baud rate, 0 for no pacing', type=int, default=115200)
+    parser.add_argument('--loss', help='probability to drop a frame sent to the host', type=float, default=0.0)
+    parser.add_argument('--corrupt', help='probability to corrupt a byte of a frame sent to the host',
+                        type=float, default=0.0)
+    parser.add_argument('--seed', help='random seed for frame loss', type=int, default=None)
+    parser.add_argument('--address', help='emulated station ipv4 address', default='192.168.1.50')
+    parser.add_argument('--serial-number', dest='serialNumber', help='serial number answered to +CGSN',
+                        default='0000000000')
+    parser.add_argument('--startup-delay', dest='startupDelay', help='seconds from +CPWROFF to +STARTUP',
+                        type=float, default=0.05)
+    parser.add_argument('--wifi-delay', dest='wifiDelay', help='seconds from +UWSCA to +UUWLE',
+                        type=float, default=0.05)
+    parser.add_argument('--dhcp-delay', dest='dhcpDelay', help='seconds from +UUWLE to +UUNU',
+                        type=float, default=0.05)
+    parser.add_argument('--drop-interval', dest='dropInterval', type=float, default=0,
+                        help='mean seconds between injected link drops, 0 for none')
+    parser.add_argument('--drop-wifi', dest='dropWifi', type=float, default=0.5,
+                        help='probability that an injected drop takes down the Wi-Fi link instead of a peer')
+    parser.add_argument('-v', '--verbose', help='log every AT command and frame', action='store_true')
+    return parser
+
+if __name__ == '__main__':
+    args = argParser().parse_args()
+    simulator = OdinSimulator(args)
+    print('{}, ODIN-W2 simulator on {}'.format(datetime.datetime.now(), simulator.device), flush=True)
+    simulator.serveForever()
@@ -0,0 +1,85 @@
+import importlib
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+odin = importlib.import_module('client-odin-w2')
+
+OkFrame = odin.edmFrame(odin.OdinEdmMsg.AtConf, b'\r\nOK\r\n')
+DataFrame = odin.edmFrame(odin.OdinEdmMsg.DataEv, b'\x01hello')
+
+class EdmDecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = odin.OdinEdmDecoder()
+
+    def feedAll(self, chunks):
+        frames = []
+        for chunk in chunks:
+            frames += self.decoder.feed(chunk)
+        return frames
+
+    def testWholeFrames(self):
+        frames = self.decoder.feed(OkFrame + DataFrame)
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.AtConf, odin.OdinEdmMsg.DataEv])
+        self.assertEqual(frames[0].content, b'\r\nOK\r\n')
+        self.assertEqual(frames[1].content, b'\x01hello')
+        self.assertEqual(self.decoder.resyncCount, 0)
+
+    def testSplitFeeds(self):
+        stream = OkFrame + DataFrame + OkFrame
+        frames = self.feedAll([stream[i:i + 1] for i in range(len(stream))])
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.AtConf, odin.OdinEdmMsg.DataEv,
+                                                    odin.OdinEdmMsg.AtConf])
+        self.assertEqual(self.decoder.resyncCount, 0)
+
+    def testResyncOnGarbage(self):
+        frames = self.feedAll([b'\x00\x13garbage', OkFrame[:4], OkFrame[4:]])
+        self.assertEqual([x.content for x in frames], [b'\r\nOK\r\n'])
+        self.assertGreater(self.decoder.resyncCount, 0)
+
+    def testBadEfd(self):
+        bad = bytearray(OkFrame)
+        bad[-1] = 0x00
+        frames = self.decoder.feed(bytes(bad) + DataFrame)
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.DataEv])
+        self.assertEqual(self.decoder.resyncCount, 1)
+
+    def testStrayHeaderDoesNotHoldBackFrames(self):
+        frames = self.decoder.feed(b'\xaa\x0f\xff' + OkFrame * 3)
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(len(self.decoder.feed(OkFrame)), 1)
+
+    def testUnknownMessageType(self):
+        frames = self.decoder.feed(b'\xaa\x00\x02\x12\x34\x55' + OkFrame)
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.AtConf])
+        self.assertEqual(self.decoder.resyncCount, 1)
+
+    def testDataWithoutChannel(self):
+        noChannel = odin.edmFrame(odin.OdinEdmMsg.DataEv, b'')
+        frames = self.decoder.feed(noChannel + DataFrame)
+        self.assertEqual([x.content for x in frames], [b'\x01hello'])
+        self.assertEqual(self.decoder.resyncCount, 1)
+        self.decoder.dataSink = lambda channelId, data: frames.append(channelId)
+        self.assertEqual(self.decoder.feed(noChannel + OkFrame)[0].content, b'\r\nOK\r\n')
+        self.assertEqual(self.decoder.resyncCount, 2)
+
+    def testDataSink(self):
+        received = []
+        self.decoder.dataSink = lambda channelId, data: received.append((channelId, bytes(data)))
+        frames = self.decoder.feed(DataFrame + OkFrame)
+        self.assertEqual(received, [(1, b'hello')])
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.AtConf])
+
+    def testChannelSinkInStreamOrder(self):
+        received = []
+        self.decoder.dataSink = lambda channelId, data: received.append(('data', channelId))
+        self.decoder.channelSink = lambda message: received.append((message.type.name, message.event.channelId))
+        connEv = odin.edmFrame(odin.OdinEdmMsg.ConnEv, bytes([1, 2, 0]) + bytes(12))
+        discEv = odin.edmFrame(odin.OdinEdmMsg.DiscEv, b'\x01')
+        frames = self.decoder.feed(connEv + DataFrame + discEv)
+        self.assertEqual(received, [('ConnEv', 1), ('data', 1), ('DiscEv', 1)])
+        self.assertEqual([x.type for x in frames], [odin.OdinEdmMsg.ConnEv, odin.OdinEdmMsg.DiscEv])
+
+if __name__ == '__main__':
+    unittest.main()